@@ -1,32 +1,96 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import models as m
-from database import get_db
+import passwords
+from database import open_read_session, open_write_session
 from config import settings
+from cache import TTLCache
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_workers = settings.PASSWORD_HASH_WORKERS
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+token_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+principal_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+# Увеличивается при каждом сбросе пользователя, как поколение каталога.
+_principal_generation = 0
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    email: str
+    role_id: int
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(m.User).filter(m.User.username == username).first()
-    if not user or not verify_password(password, user.password):
+    @classmethod
+    def from_user(cls, user: m.User) -> "Principal":
+        return cls(id=user.id, username=user.username, email=user.email, role_id=user.role_id)
+
+def invalidate_user(user_id: int):
+    global _principal_generation
+    _principal_generation += 1
+    principal_cache.pop(user_id)
+
+def auth_cache_stats() -> dict:
+    return {"tokens": token_cache.stats(), "principals": principal_cache.stats()}
+
+def set_password_workers(workers: int):
+    global _hash_pool, _hash_workers
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=True)
+    _hash_pool = None
+    _hash_workers = workers
+
+async def _run_hashing(fn, *args):
+    global _hash_pool
+    if _hash_workers <= 0:
+        return await run_in_threadpool(fn, *args)
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(max_workers=_hash_workers)
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, fn, *args)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(passwords.hash_password, password, settings.BCRYPT_ROUNDS)
+
+async def _store_rehashed_password(user: m.User, new_hash: str):
+    async with open_write_session() as db:
+        await db.execute(
+            update(m.User)
+            .where(m.User.id == user.id, m.User.password == user.password)
+            .values(password=new_hash)
+        )
+        await db.commit()
+    user.password = new_hash
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await db.scalar(select(m.User).where(m.User.username == username))
+    # Соединение не нужно на время проверки пароля, а сохранение нового
+    # хэша берет свою сессию. Загруженный user остается доступен.
+    await db.close()
+    if not user:
+        return None
+    verified, new_hash = await _run_hashing(
+        passwords.verify_and_update, password, user.password, settings.BCRYPT_ROUNDS
+    )
+    if not verified:
         return None
+    if new_hash:
+        await _store_rehashed_password(user, new_hash)
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -35,21 +99,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось проверить токен",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub", "role")
-        if user_id is None:
+    user_id = token_cache.get(token)
+    if user_id is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_id = payload.get("sub", "role")
+            if user_id is None:
+                raise credentials_exception
+            user_id = int(user_id)
+        except (JWTError, ValueError):
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        token_cache.set(token, user_id, ttl=payload.get("exp", 0) - time.time())
+
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
 
-    user = db.query(m.User).filter(m.User.id == int(user_id)).first()
+    # Своя короткая сессия: соединение возвращается в пул до вызова
+    # обработчика и не удерживается на все время запроса.
+    generation = _principal_generation
+    async with open_read_session() as db:
+        user = await db.get(m.User, user_id)
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal.from_user(user)
+    # Пользователя могли изменить, пока строка читалась из базы.
+    if generation == _principal_generation:
+        principal_cache.set(user_id, principal)
+    return principal
@@ -0,0 +1,236 @@
+"""Нагрузочный тест API по смешанному набору сценариев.
+
+Приложение запускается внутри процесса через ASGI на временной базе, которую
+заполняет datagen.py с заданным числом товаров, покупателей, отзывов и заказов. Виртуальные пользователи выбирают сценарии с весами из SCENARIOS.
+По каждому маршруту считаются p50/p95/p99 задержки и запросы в секунду.
+Результат можно сохранить в JSON и сравнить с прошлым запуском.
+
+    python bench/api_benchmark.py --products 5000 --duration 20 --output new.json
+    python bench/api_benchmark.py --output new.json --compare old.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CWD = os.getcwd()
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="bench-api-"))
+os.environ["DB_NAME"] = "bench_api.db"
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from datagen import BRANDS, CATEGORIES, WORDS, DatasetSize, generate
+
+SEARCH_TERMS = [name for name, _, _ in CATEGORIES[:2]] + BRANDS + WORDS
+
+BUYER = ("Покупатель", "user123")
+MANAGER = ("Менеджер", "manag123")
+
+def percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+def seed(args) -> list:
+    from sqlalchemy import select, update
+    from database import engine
+    import models as m
+
+    generate(DatasetSize(
+        products=args.products,
+        users=args.users,
+        orders=args.orders,
+        reviews=args.reviews,
+        seed=args.seed,
+    ), log=lambda message: None)
+    # Сценарий create_order не должен упираться в остатки.
+    with engine.begin() as connection:
+        connection.execute(update(m.Product).values(remaining_stock=1_000_000))
+        return list(connection.scalars(select(m.Product.id)))
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[route].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+async def browse(ctx):
+    params = {"limit": 20, "page": ctx.rng.randint(1, 20)}
+    if ctx.rng.random() < 0.5:
+        params["category_id"] = ctx.rng.randint(1, 2)
+    if ctx.rng.random() < 0.3:
+        params["sort"] = ctx.rng.choice(["price", "-price", "rating"])
+    await ctx.call("GET /api/product/products", "GET", "/api/product/products", params=params)
+
+async def search(ctx):
+    params = {"q": ctx.rng.choice(SEARCH_TERMS)[:5], "limit": 20}
+    await ctx.call("GET /api/product/products?q", "GET", "/api/product/products", params=params)
+
+async def view_product(ctx):
+    product_id = ctx.rng.choice(ctx.product_ids)
+    await ctx.call("GET /api/product/{id}", "GET", f"/api/product/{product_id}")
+    await ctx.call("GET /api/reviews/product/{id}", "GET", f"/api/reviews/product/{product_id}")
+
+async def login(ctx):
+    username, password = BUYER
+    await ctx.call("POST /login", "POST", "/login", data={"username": username, "password": password})
+
+async def create_order(ctx):
+    items = [
+        {"product_id": product_id, "quantity": 1, "price_at_purchase": 0}
+        for product_id in ctx.rng.sample(ctx.product_ids, 2)
+    ]
+    await ctx.call("POST /api/orders/create", "POST", "/api/orders/create", json={"items": items}, headers=ctx.buyer)
+
+async def manager_orders(ctx):
+    params = {"limit": 50}
+    if ctx.rng.random() < 0.5:
+        params["page"] = ctx.rng.randint(1, 10)
+    await ctx.call("GET /api/orders/", "GET", "/api/orders/", params=params, headers=ctx.manager)
+
+# (сценарий, вес)
+SCENARIOS = [
+    (browse, 40),
+    (search, 20),
+    (view_product, 20),
+    (login, 2),
+    (create_order, 8),
+    (manager_orders, 10),
+]
+
+class Context:
+    def __init__(self, client, recorder, rng, product_ids, buyer, manager):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.product_ids = product_ids
+        self.buyer = buyer
+        self.manager = manager
+
+    async def call(self, route, method, url, **kwargs):
+        return await self.recorder.call(self.client, route, method, url, **kwargs)
+
+async def token(client, username, password) -> dict:
+    response = await client.post("/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def run(args, product_ids) -> dict:
+    import httpx
+    import main
+
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        buyer = await token(client, *BUYER)
+        manager = await token(client, *MANAGER)
+        scenarios, weights = zip(*SCENARIOS)
+
+        async def user(index: int, deadline: float):
+            ctx = Context(client, recorder, random.Random(args.seed + index), product_ids, buyer, manager)
+            while time.perf_counter() < deadline:
+                await ctx.rng.choices(scenarios, weights)[0](ctx)
+
+        if args.warmup:
+            await asyncio.gather(*(user(i, time.perf_counter() + args.warmup) for i in range(args.concurrency)))
+            recorder.latencies.clear()
+            recorder.errors.clear()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i, started + args.duration) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, latencies in sorted(recorder.latencies.items()):
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": recorder.errors[route],
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+        }
+    total = sum(route["requests"] for route in routes.values())
+    return {"elapsed_s": round(elapsed, 2), "total_rps": round(total / elapsed, 2), "routes": routes}
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_report(result: dict, baseline: Optional[dict] = None):
+    print(f"{'маршрут':<34}{'запросов':>9}{'ошибок':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, stats in result["routes"].items():
+        line = (
+            f"{route:<34}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>9}"
+            f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+        )
+        old = (baseline or {}).get("routes", {}).get(route)
+        if old and old["p95_ms"]:
+            line += f"   p95 {stats['p95_ms'] / old['p95_ms'] - 1:+.0%}, rps {stats['rps'] / old['rps'] - 1:+.0%}"
+        print(line)
+    print(f"всего: {result['total_rps']} запросов/с за {result['elapsed_s']} с")
+    if baseline:
+        print(f"было:  {baseline['total_rps']} запросов/с (ревизия {baseline['meta']['revision']})")
+
+def main_bench(args):
+    product_ids = seed(args)
+    result = asyncio.run(run(args, product_ids))
+    result["meta"] = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "products": args.products,
+        "users": args.users,
+        "reviews": args.reviews,
+        "orders": args.orders,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "seed": args.seed,
+        "db_async": os.environ.get("DB_ASYNC", "true"),
+        "db_engine_mode": os.environ.get("DB_ENGINE_MODE", "wal"),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--reviews", type=int, default=10000)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="длительность замера в секундах")
+    parser.add_argument("--warmup", type=float, default=2, help="прогрев в секундах, не входит в результат")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="путь к JSON-файлу с результатами")
+    parser.add_argument("--compare", help="JSON-файл прошлого запуска для сравнения")
+    args = parser.parse_args()
+    for name in ("output", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.join(CWD, getattr(args, name)))
+    main_bench(args)
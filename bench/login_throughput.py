@@ -0,0 +1,108 @@
+"""Пропускная способность /login в зависимости от числа процессов хеширования.
+
+Приложение запускается внутри процесса через ASGI на временной базе из
+seed.py. Для каждого числа процессов выполняется серия параллельных логинов,
+а параллельно с ней замеряется задержка каталога товаров, чтобы было видно,
+насколько хеширование мешает остальным запросам. Значение 0 означает
+хеширование в пуле потоков.
+
+    python bench/login_throughput.py --workers 0 1 2 4 --requests 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import runpy
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CWD = os.getcwd()
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="bench-login-"))
+os.environ["DB_NAME"] = "bench_login.db"
+os.environ.setdefault("SECRET_KEY", "bench")
+
+runpy.run_path(os.path.join(ROOT, "seed.py"))
+
+import httpx
+import auth
+import main
+
+CREDENTIALS = {"username": "Покупатель", "password": "user123"}
+
+def percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+async def run(workers: int, total: int, concurrency: int) -> dict:
+    auth.set_password_workers(workers)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/login", data=CREDENTIALS)
+
+        logins, catalog = [], []
+        remaining = iter(range(total))
+        stop = asyncio.Event()
+
+        async def login_worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.post("/login", data=CREDENTIALS)
+                response.raise_for_status()
+                logins.append((time.perf_counter() - started) * 1000)
+
+        async def catalog_probe():
+            while not stop.is_set():
+                started = time.perf_counter()
+                response = await client.get("/api/product/products")
+                response.raise_for_status()
+                catalog.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.01)
+
+        probe = asyncio.create_task(catalog_probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    return {
+        "workers": workers,
+        "requests": total,
+        "concurrency": concurrency,
+        "logins_per_sec": round(total / elapsed, 2),
+        "login_p50_ms": round(percentile(logins, 50), 2),
+        "login_p95_ms": round(percentile(logins, 95), 2),
+        "catalog_p50_ms": round(percentile(catalog, 50), 2),
+        "catalog_p95_ms": round(percentile(catalog, 95), 2),
+    }
+
+async def main_bench(args):
+    results = []
+    for workers in args.workers:
+        result = await run(workers, args.requests, args.concurrency)
+        results.append(result)
+        print(
+            f"workers={result['workers']:>2}  {result['logins_per_sec']:>8} login/s  "
+            f"login p50={result['login_p50_ms']}ms p95={result['login_p95_ms']}ms  "
+            f"catalog p50={result['catalog_p50_ms']}ms p95={result['catalog_p95_ms']}ms"
+        )
+    auth.set_password_workers(0)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", help="путь к JSON-файлу с результатами")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.join(CWD, args.output)
+    asyncio.run(main_bench(args))
@@ -0,0 +1,89 @@
+"""Проверка отсутствия перепродажи при параллельных заказах.
+
+Создает временную базу, заводит товар с ограниченным остатком и запускает
+много покупателей одновременно. После завершения сверяет сумму успешно
+заказанного количества с остатком: если продано больше, чем было на складе,
+или остаток стал отрицательным, скрипт завершается с кодом 1.
+
+Режим движка берется из настроек, поэтому проверку стоит запускать и так:
+
+    python bench/oversell_check.py
+    DB_ENGINE_MODE=default python bench/oversell_check.py
+    DB_ASYNC=false python bench/oversell_check.py
+"""
+import argparse
+import asyncio
+import os
+import random
+import runpy
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="oversell-"))
+os.environ["DB_NAME"] = "oversell.db"
+os.environ.setdefault("SECRET_KEY", "oversell-check")
+
+runpy.run_path(os.path.join(ROOT, "seed.py"))
+
+import httpx
+import main
+
+async def check(buyers: int, stock: int, max_quantity: int, seed: int) -> int:
+    rng = random.Random(seed)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=60) as client:
+        async def token(username, password):
+            response = await client.post("/login", data={"username": username, "password": password})
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        manager = await token("Менеджер", "manag123")
+        buyer = await token("Покупатель", "user123")
+        response = await client.post(
+            "/api/product/create",
+            json={"name": "Дефицитный товар", "price": 100, "remaining_stock": stock, "category_id": 1},
+            headers=manager,
+        )
+        product_id = response.json()["id"]
+
+        async def buy(quantity):
+            response = await client.post(
+                "/api/orders/create",
+                json={"items": [{"product_id": product_id, "quantity": quantity, "price_at_purchase": 0}]},
+                headers=buyer,
+            )
+            return quantity if response.status_code == 200 else 0, response.status_code
+
+        results = await asyncio.gather(*(buy(rng.randint(1, max_quantity)) for _ in range(buyers)))
+
+    sold = sum(quantity for quantity, _ in results)
+    statuses = {}
+    for _, status_code in results:
+        statuses[status_code] = statuses.get(status_code, 0) + 1
+
+    connection = sqlite3.connect(os.environ["DB_NAME"])
+    remaining = connection.execute(
+        "SELECT remaining_stock FROM products WHERE id = ?", (product_id,)
+    ).fetchone()[0]
+    ordered = connection.execute(
+        "SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = ?", (product_id,)
+    ).fetchone()[0]
+
+    print(f"покупателей: {buyers}, остаток был: {stock}, продано: {sold}, в заказах: {ordered}, осталось: {remaining}")
+    print(f"ответы: {statuses}")
+    if remaining < 0 or sold > stock or sold != ordered or stock - sold != remaining:
+        print("ОШИБКА: остатки не сходятся")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--max-quantity", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(check(args.buyers, args.stock, args.max_quantity, args.seed)))
@@ -0,0 +1,159 @@
+"""Сравнение способов сериализации списков товаров и заказов.
+
+Сравниваются три пути для одной и той же страницы:
+
+- fastapi: ORM-объекты проверяются через response_model (from_attributes),
+  затем jsonable_encoder и стандартный json — как при возврате объектов
+  из обработчика;
+- pydantic: TypeAdapter.validate_python + dump_json — путь каталога до
+  перехода на кортежи;
+- orjson: словари из кортежей колонок и orjson — текущий путь списков.
+
+Для каждого пути меряется только сериализация и сериализация вместе с
+выборкой из базы. Перед замером проверяется, что все пути дают одинаковый JSON.
+
+    python bench/serialization.py --rows 100 --repeat 200
+"""
+import argparse
+import json
+import os
+import runpy
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="bench-serialization-"))
+os.environ["DB_NAME"] = "bench_serialization.db"
+os.environ.setdefault("SECRET_KEY", "bench")
+
+runpy.run_path(os.path.join(ROOT, "seed.py"))
+
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, selectinload
+from database import engine
+import models as m
+import pyd
+from routers.orders_router import ORDER_FIELDS, _build_orders, _order_rows_query
+from routers.product_router import PRODUCT_FIELDS
+from serializers import dumps
+
+PRODUCTS = TypeAdapter(List[pyd.ProductBase])
+ORDERS = TypeAdapter(List[pyd.OrderBase])
+
+def fill(rows: int):
+    now = datetime.now()
+    with engine.begin() as connection:
+        connection.execute(insert(m.Product), [
+            {
+                "name": f"Товар {i}",
+                "price": 1000 + i,
+                "description": "описание товара для замера сериализации",
+                "remaining_stock": i % 50,
+                "category_id": 1 + i % 2,
+                "created_at": now,
+            }
+            for i in range(rows)
+        ])
+        product_ids = [row.id for row in connection.execute(select(m.Product.id))]
+        connection.execute(insert(m.Order), [
+            {"id": 100 + i, "user_id": 1, "status_id": 1, "total_amount": 5000, "created_at": now, "updated_at": now}
+            for i in range(rows)
+        ])
+        connection.execute(insert(m.OrderItem), [
+            {"order_id": 100 + i, "product_id": product_ids[(i + k) % len(product_ids)], "quantity": 1, "price_at_purchase": 1000}
+            for i in range(rows)
+            for k in range(3)
+        ])
+
+def measure(fn, repeat: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+def report(title: str, results: dict):
+    baseline = results["fastapi"]
+    print(title)
+    for name, ms in results.items():
+        print(f"  {name:<10}{ms:>9.3f} мс  x{baseline / ms:.1f}")
+
+def main_bench(args):
+    fill(args.rows)
+    session = Session(bind=engine)
+    product_query = select(m.Product).order_by(m.Product.id).limit(args.rows)
+    product_rows_query = (
+        select(*PRODUCT_FIELDS.columns(PRODUCT_FIELDS.names))
+        .outerjoin(m.ProductRatingStats, m.ProductRatingStats.product_id == m.Product.id)
+        .order_by(m.Product.id).limit(args.rows)
+    )
+    order_query = select(m.Order).options(selectinload(m.Order.items)).order_by(m.Order.id).limit(args.rows)
+    order_rows_query = _order_rows_query(
+        select(*ORDER_FIELDS.columns(ORDER_FIELDS.names)).order_by(m.Order.id).limit(args.rows)
+    )
+    build_product = PRODUCT_FIELDS.builder(PRODUCT_FIELDS.names)
+
+    def build_orders(rows):
+        return _build_orders(rows, ORDER_FIELDS.names)
+
+    def fetch_products():
+        return session.scalars(product_query.execution_options(populate_existing=True)).all()
+
+    def fetch_product_rows():
+        return session.execute(product_rows_query).all()
+
+    def fetch_orders():
+        return session.scalars(order_query.execution_options(populate_existing=True)).all()
+
+    def fetch_order_rows():
+        return session.execute(order_rows_query).all()
+
+    def via_fastapi(adapter, objects):
+        return json.dumps(jsonable_encoder(adapter.validate_python(objects, from_attributes=True))).encode()
+
+    def via_pydantic(adapter, objects):
+        return adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+
+    products, product_rows = fetch_products(), fetch_product_rows()
+    orders, order_rows = fetch_orders(), fetch_order_rows()
+
+    expected = json.loads(via_fastapi(PRODUCTS, products))
+    assert json.loads(via_pydantic(PRODUCTS, products)) == expected
+    assert json.loads(dumps([build_product(row) for row in product_rows])) == expected
+    expected = json.loads(via_fastapi(ORDERS, orders))
+    assert json.loads(dumps(build_orders(order_rows))) == expected
+
+    print(f"строк на странице: {args.rows}, повторов: {args.repeat}")
+    report("товары, сериализация", {
+        "fastapi": measure(lambda: via_fastapi(PRODUCTS, products), args.repeat),
+        "pydantic": measure(lambda: via_pydantic(PRODUCTS, products), args.repeat),
+        "orjson": measure(lambda: dumps([build_product(row) for row in product_rows]), args.repeat),
+    })
+    report("товары, выборка + сериализация", {
+        "fastapi": measure(lambda: via_fastapi(PRODUCTS, fetch_products()), args.repeat),
+        "pydantic": measure(lambda: via_pydantic(PRODUCTS, fetch_products()), args.repeat),
+        "orjson": measure(lambda: dumps([build_product(row) for row in fetch_product_rows()]), args.repeat),
+    })
+    report("заказы, сериализация", {
+        "fastapi": measure(lambda: via_fastapi(ORDERS, orders), args.repeat),
+        "pydantic": measure(lambda: via_pydantic(ORDERS, orders), args.repeat),
+        "orjson": measure(lambda: dumps(build_orders(order_rows)), args.repeat),
+    })
+    report("заказы, выборка + сериализация", {
+        "fastapi": measure(lambda: via_fastapi(ORDERS, fetch_orders()), args.repeat),
+        "pydantic": measure(lambda: via_pydantic(ORDERS, fetch_orders()), args.repeat),
+        "orjson": measure(lambda: dumps(build_orders(fetch_order_rows())), args.repeat),
+    })
+    session.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100, help="размер страницы")
+    parser.add_argument("--repeat", type=int, default=200)
+    main_bench(parser.parse_args())
@@ -0,0 +1,78 @@
+"""Проверка, что параллельные запросы не исчерпывают соединения с базой.
+
+Создает временную базу и --users покупателей, выдает каждому новый токен
+(кэш пользователей пуст) и одновременно запрашивает их заказы. Обработчику
+нужна сессия самого маршрута и, при промахе кэша, сессия get_current_user.
+Если запросы не укладываются в --timeout секунд или получают ошибку,
+скрипт завершается с кодом 1. Особенно важно проверять синхронный режим:
+
+    python bench/session_pool_check.py
+    DB_ASYNC=false python bench/session_pool_check.py
+"""
+import argparse
+import asyncio
+import os
+import runpy
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="session-pool-"))
+os.environ["DB_NAME"] = "session_pool.db"
+os.environ.setdefault("SECRET_KEY", "session-pool-check")
+
+runpy.run_path(os.path.join(ROOT, "seed.py"))
+
+import httpx
+import auth
+import main
+
+def create_users(count: int) -> list:
+    connection = sqlite3.connect(os.environ["DB_NAME"])
+    with connection:
+        first = connection.execute("SELECT max(id) FROM users").fetchone()[0] + 1
+        connection.executemany(
+            "INSERT INTO users (id, username, email, password, role_id) VALUES (?, ?, ?, '-', 1)",
+            [(first + i, f"pool{i}", f"pool{i}@example.com") for i in range(count)],
+        )
+    return list(range(first, first + count))
+
+async def check(users: int, rounds: int, timeout: float) -> int:
+    user_ids = create_users(users * rounds)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=timeout) as client:
+        async def orders(user_id):
+            token = auth.create_access_token({"sub": str(user_id)})
+            response = await client.get("/api/orders/user_orders", headers={"Authorization": f"Bearer {token}"})
+            return response.status_code
+
+        statuses = {}
+        started = time.perf_counter()
+        for i in range(rounds):
+            batch = user_ids[i * users:(i + 1) * users]
+            try:
+                results = await asyncio.wait_for(asyncio.gather(*(orders(user_id) for user_id in batch)), timeout)
+            except asyncio.TimeoutError:
+                print(f"ОШИБКА: {users} параллельных запросов не завершились за {timeout} с")
+                return 1
+            for status_code in results:
+                statuses[status_code] = statuses.get(status_code, 0) + 1
+        elapsed = time.perf_counter() - started
+
+    print(f"запросов: {users * rounds} ({users} одновременно), ответы: {statuses}, время: {elapsed:.2f} с")
+    if set(statuses) != {200}:
+        print("ОШИБКА: не все запросы выполнены успешно")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=30, help="одновременных запросов с новыми токенами")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=15)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(check(args.users, args.rounds, args.timeout)))
@@ -0,0 +1,109 @@
+"""Проверка оптимистичных блокировок при параллельном редактировании.
+
+Создает временную базу и товар, затем несколько менеджеров одновременно
+увеличивают его остаток на 1 через GET + PUT с версией. На 409 менеджер
+перечитывает товар и повторяет попытку. Параллельно покупатели оформляют
+заказы на тот же товар, что тоже меняет версию. В конце остаток сверяется
+с числом успешных изменений и заказов: если какое-то изменение потерялось,
+скрипт завершается с кодом 1. Печатаются число конфликтов и изменений в секунду.
+
+    python bench/version_conflicts.py --managers 8 --updates 25 --buyers 50
+"""
+import argparse
+import asyncio
+import os
+import runpy
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="version-conflicts-"))
+os.environ["DB_NAME"] = "version_conflicts.db"
+os.environ.setdefault("SECRET_KEY", "version-conflicts")
+
+runpy.run_path(os.path.join(ROOT, "seed.py"))
+
+import httpx
+import main
+
+STOCK = 1000
+
+async def check(managers: int, updates: int, buyers: int) -> int:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=60) as client:
+        async def token(username, password):
+            response = await client.post("/login", data={"username": username, "password": password})
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        manager = await token("Менеджер", "manag123")
+        buyer = await token("Покупатель", "user123")
+        response = await client.post(
+            "/api/product/create",
+            json={"name": "Спорный товар", "price": 100, "remaining_stock": STOCK, "category_id": 1},
+            headers=manager,
+        )
+        product_id = response.json()["id"]
+        conflicts = 0
+
+        async def edit():
+            nonlocal conflicts
+            for _ in range(updates):
+                while True:
+                    product = (await client.get(f"/api/product/{product_id}")).json()
+                    response = await client.put(
+                        f"/api/product/update/{product_id}",
+                        json={
+                            "name": product["name"],
+                            "price": product["price"],
+                            "remaining_stock": product["remaining_stock"] + 1,
+                            "category_id": product["category_id"],
+                            "version": product["version"],
+                        },
+                        headers=manager,
+                    )
+                    if response.status_code != 409:
+                        response.raise_for_status()
+                        break
+                    conflicts += 1
+
+        async def buy():
+            response = await client.post(
+                "/api/orders/create",
+                json={"items": [{"product_id": product_id, "quantity": 1, "price_at_purchase": 0}]},
+                headers=buyer,
+            )
+            return response.status_code == 200
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(edit() for _ in range(managers)),
+            *(buy() for _ in range(buyers)),
+        )
+        elapsed = time.perf_counter() - started
+
+    bought = sum(1 for result in results[managers:] if result)
+    edits = managers * updates
+    connection = sqlite3.connect(os.environ["DB_NAME"])
+    remaining, version = connection.execute(
+        "SELECT remaining_stock, version FROM products WHERE id = ?", (product_id,)
+    ).fetchone()
+    expected = STOCK + edits - bought
+
+    print(f"изменений: {edits}, заказов: {bought}, конфликтов: {conflicts}, версия: {version}")
+    print(f"остаток: {remaining}, ожидался: {expected}, изменений в секунду: {edits / elapsed:.1f}")
+    if remaining != expected or version != 1 + edits + bought:
+        print("ОШИБКА: часть изменений потерялась")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--managers", type=int, default=8)
+    parser.add_argument("--updates", type=int, default=25, help="изменений на одного менеджера")
+    parser.add_argument("--buyers", type=int, default=50)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(check(args.managers, args.updates, args.buyers)))
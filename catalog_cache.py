@@ -0,0 +1,99 @@
+import hashlib
+import time
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Hashable, Iterable, Optional
+from fastapi import Request, Response
+from cache import TTLCache
+from config import settings
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    last_modified: float
+    headers: dict = field(default_factory=dict)
+
+class CatalogCache:
+    """Кэш ответов каталога с инвалидацией при изменении товаров и категорий.
+
+    Записи товаров хранятся под ключом ("product", id) и сбрасываются точечно,
+    списки и категории привязаны к поколению каталога, которое увеличивается
+    при любом изменении.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = TTLCache(maxsize, ttl)
+        self.generation = 0
+        self.last_modified = time.time()
+
+    def list_key(self, *parts: Hashable) -> tuple:
+        return ("list", self.generation, *parts)
+
+    def product_key(self, product_id: int) -> tuple:
+        return ("product", product_id)
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        return self.entries.get(key)
+
+    def entry(self, body: bytes, headers: Optional[dict] = None) -> CachedResponse:
+        return CachedResponse(
+            body=body,
+            etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+            last_modified=self.last_modified,
+            headers=headers or {},
+        )
+
+    def store(self, key: tuple, body: bytes, generation: int, headers: Optional[dict] = None) -> CachedResponse:
+        entry = self.entry(body, headers)
+        # Каталог мог измениться, пока ответ собирался из базы.
+        if generation == self.generation:
+            self.entries.set(key, entry)
+        return entry
+
+    def invalidate_lists(self):
+        self.generation += 1
+        self.last_modified = time.time()
+
+    def invalidate_products(self, product_ids: Iterable[int]):
+        """Сбрасывает карточки товаров и все списки; без товаров ничего не делает."""
+        changed = False
+        for product_id in product_ids:
+            self.entries.pop(self.product_key(product_id))
+            changed = True
+        if changed:
+            self.invalidate_lists()
+
+    def invalidate_all(self):
+        self.entries.clear()
+        self.invalidate_lists()
+
+    def stats(self) -> dict:
+        return {"generation": self.generation, **self.entries.stats()}
+
+catalog_cache = CatalogCache(settings.CATALOG_CACHE_SIZE, settings.CATALOG_CACHE_TTL)
+
+def _not_modified(request: Request, entry: CachedResponse) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or entry.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(entry.last_modified) <= since
+    return False
+
+def cached_response(request: Request, entry: CachedResponse) -> Response:
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": formatdate(entry.last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+        **entry.headers,
+    }
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
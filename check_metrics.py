@@ -0,0 +1,70 @@
+"""Проверка шаблонов маршрутов в метриках.
+
+Скрипт собирает небольшое приложение с MetricsMiddleware, в котором роутеры
+подключены с префиксами (в том числе вложенные друг в друга), выполняет по
+одному запросу к каждому маршруту и сравнивает метку route с ожидаемым
+шаблоном. Если шаблон не совпал, скрипт печатает его и завершается с кодом 1.
+
+    python check_metrics.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from metrics import MetricsMiddleware, MetricsRegistry, UNMATCHED_ROUTE
+
+items = APIRouter(prefix="/items")
+
+@items.get("/{item_id}")
+async def get_item(item_id: int):
+    return {}
+
+@items.get("/{item_id}/reviews/{review_id}")
+async def get_review(item_id: int, review_id: int):
+    return {}
+
+@items.get("/files/{file_path:path}")
+async def get_file(file_path: str):
+    return {}
+
+shop = APIRouter(prefix="/shop")
+shop.include_router(items, prefix="/v1")
+
+app = FastAPI()
+
+@app.get("/health")
+async def health():
+    return {}
+
+app.include_router(items, prefix="/api")
+app.include_router(shop, prefix="/api")
+
+CASES = [
+    ("/health", "/health"),
+    ("/api/items/5", "/api/items/{item_id}"),
+    ("/api/items/5/reviews/7", "/api/items/{item_id}/reviews/{review_id}"),
+    ("/api/items/files/a/b/c.txt", "/api/items/files/{file_path:path}"),
+    ("/api/shop/v1/items/5", "/api/shop/v1/items/{item_id}"),
+    ("/api/shop/v1/items/files/a/b", "/api/shop/v1/items/files/{file_path:path}"),
+    ("/api/missing", UNMATCHED_ROUTE),
+]
+
+def main() -> int:
+    problems = 0
+    for path, expected in CASES:
+        registry = MetricsRegistry()
+        TestClient(MetricsMiddleware(app, registry)).get(path)
+        routes = [metrics.labels for metrics in registry.routes.values()]
+        label = f'method="GET",route="{expected}"'
+        if routes != [label]:
+            problems += 1
+            print(f"{path}: ожидался {label}, получено {routes}")
+    print(f"Проверено маршрутов: {len(CASES)}, проблем: {problems}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
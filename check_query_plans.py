@@ -0,0 +1,156 @@
+"""Проверка планов SQL-запросов, которые выполняют роутеры.
+
+Скрипт создает временную базу, заполняет ее через seed.py, выполняет запросы
+ко всем маршрутам API и перехватывает каждый SQL-запрос. Затем для каждого
+запроса строится EXPLAIN QUERY PLAN. Если запрос с условием WHERE полностью
+сканирует таблицу или один и тот же запрос повторяется в одном обращении
+к API не менее DB_N_PLUS_ONE_THRESHOLD раз (вероятный N+1), скрипт печатает
+его и завершается с кодом 1.
+
+    python check_query_plans.py
+"""
+import os
+import re
+import runpy
+import sqlite3
+import sys
+import tempfile
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="query-plans-"))
+os.environ["DB_NAME"] = "query_plans.db"
+os.environ.setdefault("SECRET_KEY", "query-plan-check")
+
+runpy.run_path(os.path.join(ROOT, "seed.py"))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+import database
+import main
+from config import settings
+import models as m
+
+USERS = {
+    "user": ("Покупатель", "user123"),
+    "manager": ("Менеджер", "manag123"),
+    "admin": ("Админ", "admin123"),
+}
+
+# (метод, путь, параметры запроса, роль, таблицы, полный просмотр которых допустим)
+SCENARIOS = [
+    ("GET", "/api/product/products", {}, None, ()),
+    ("GET", "/api/product/products", {"cursor": "eyJrIjoiaWQiLCJ2IjpbMV19"}, None, ()),
+    ("GET", "/api/product/products", {"category_id": 1}, None, ()),
+    ("GET", "/api/product/products", {"category_id": 1, "min_price": 100, "max_price": 50000}, None, ()),
+    ("GET", "/api/product/products", {"min_price": 100, "max_price": 50000, "sort": "price"}, None, ()),
+    ("GET", "/api/product/products", {"q": "смарт"}, None, ()),
+    ("GET", "/api/product/products", {"sort": "rating"}, None, ()),
+    ("GET", "/api/product/products", {"sort": "rating", "cursor": "eyJrIjoicmF0aW5nIiwidiI6WzQuMCwxXX0"}, None, ()),
+    ("GET", "/api/product/products", {"name": "смарт", "category_id": 1}, None, ()),
+    ("GET", "/api/product/products", {"fields": "id,name,price", "sort": "price", "min_price": 100}, None, ()),
+    ("GET", "/api/product/1", {}, None, ()),
+    ("GET", "/api/product/batch", {"ids": [2, 99, 1]}, None, ()),
+    ("GET", "/api/category/", {}, None, ()),
+    ("GET", "/api/reviews/product/1", {}, None, ()),
+    ("GET", "/api/reviews/product/1", {"sort": "rating", "cursor": "eyJrIjoicmF0aW5nIiwidiI6WzUsMTBdfQ"}, None, ()),
+    ("GET", "/api/reviews/product/1", {"format": "ndjson"}, None, ()),
+    ("GET", "/api/orders/", {}, "manager", ()),
+    ("GET", "/api/orders/", {"cursor": "eyJrIjoiaWQiLCJ2IjpbMV19"}, "manager", ()),
+    ("GET", "/api/orders/user_orders", {}, "user", ()),
+    ("GET", "/api/orders/user_orders", {"fields": "id,status_id,total_amount"}, "user", ()),
+    ("GET", "/api/orders/", {"fields": "id,items", "cursor": "eyJrIjoiaWQiLCJ2IjpbMV19"}, "manager", ()),
+    ("GET", "/api/orders/export", {"date_from": "2020-01-01", "date_to": "2100-01-01"}, "manager", ()),
+    ("GET", "/api/orders/export", {"format": "csv", "status_id": 1, "date_from": "2020-01-01"}, "manager", ()),
+    ("GET", "/api/orders/1", {}, "user", ()),
+    ("GET", "/api/analytics/sales", {"date_from": "2020-01-01", "date_to": "2100-01-01"}, "manager", ()),
+    ("GET", "/api/analytics/sales", {"group_by": ["category", "product"], "category_id": 1}, "manager", ()),
+    ("GET", "/api/analytics/sales", {"group_by": "day", "product_id": 1, "date_from": "2020-01-01"}, "manager", ()),
+    ("GET", "/api/user/me", {}, "user", ()),
+    ("GET", "/api/user/", {}, "admin", ()),
+    # Поиск подстроки в имени и почте не может использовать индекс.
+    ("GET", "/api/user/", {"username": "адм", "role_id": 3}, "admin", ("users",)),
+    ("GET", "/api/user/1", {}, "admin", ()),
+    ("POST", "/api/orders/create", {"json": {"items": [{"product_id": 1, "quantity": 1, "price_at_purchase": 0}]}}, "user", ()),
+    # Второй запрос с тем же ключом отдает сохраненный ответ.
+    ("POST", "/api/orders/create", {"json": {"items": [{"product_id": 2, "quantity": 1, "price_at_purchase": 0}]}, "headers": {"Idempotency-Key": "plans"}}, "user", ()),
+    ("POST", "/api/orders/create", {"json": {"items": [{"product_id": 2, "quantity": 1, "price_at_purchase": 0}]}, "headers": {"Idempotency-Key": "plans"}}, "user", ()),
+    ("PUT", "/api/orders/update-status/3", {"params": {"status_id": 2}}, "manager", ()),
+    ("PUT", "/api/orders/update-items/3", {"json": {"items": [{"product_id": 2, "quantity": 1}]}}, "manager", ()),
+    ("DELETE", "/api/orders/delete/3", {}, "manager", ()),
+    ("POST", "/api/reviews/", {"json": {"product_id": 1, "rating": 5, "text": "отлично"}}, "user", ()),
+    ("PUT", "/api/reviews/1", {"json": {"rating": 4, "text": "хорошо"}}, "user", ()),
+    ("DELETE", "/api/reviews/1", {}, "user", ()),
+    ("POST", "/api/category/", {"json": {"name": "Ноутбуки"}}, "admin", ()),
+    ("POST", "/api/product/create", {"json": {"name": "Ноутбук", "price": 1000, "remaining_stock": 1, "category_id": 3}}, "manager", ()),
+    ("POST", "/api/product/import", {"content": "name,price,category\nНоутбук,900,ТВ\nПланшет,500,ТВ\n"}, "manager", ()),
+    ("PUT", "/api/product/update/3", {"json": {"name": "Ноутбук Pro", "price": 1200, "remaining_stock": 1, "category_id": 3}}, "manager", ()),
+    ("DELETE", "/api/product/delete/3", {}, "manager", ()),
+    ("PUT", "/api/category/3", {"json": {"name": "Ноутбуки и планшеты"}}, "admin", ()),
+    ("DELETE", "/api/category/3", {}, "admin", ()),
+    ("POST", "/api/user/register", {"json": {"username": "plans", "email": "plans@example.com", "password": "Plans12345"}}, None, ()),
+    ("PUT", "/api/user/4", {"json": {"username": "plans2", "email": "plans@example.com", "role_id": 1}}, "admin", ()),
+    ("DELETE", "/api/user/4", {}, "admin", ()),
+]
+
+SCAN_RE = re.compile(r"^SCAN (\w+)")
+WHERE_RE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+TABLES = set(m.Base.metadata.tables)
+
+captured = []
+
+def _capture(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+        captured.append((statement, parameters[0] if executemany else parameters))
+
+for sync_engine in {database.engine, database.async_engine.sync_engine, database.async_read_engine.sync_engine}:
+    event.listen(sync_engine, "before_cursor_execute", _capture)
+
+def full_scans(connection, statement, parameters, allowed):
+    if not WHERE_RE.search(statement):
+        return []
+    plan = connection.execute("EXPLAIN QUERY PLAN " + statement, parameters or ()).fetchall()
+    scans = []
+    for _, _, _, detail in plan:
+        match = SCAN_RE.match(detail)
+        if not match or "USING" in detail or "VIRTUAL TABLE" in detail:
+            continue
+        if match.group(1) in TABLES and match.group(1) not in allowed:
+            scans.append(detail)
+    return scans
+
+def main_check() -> int:
+    client = TestClient(main.app)
+    tokens = {}
+    for role, (username, password) in USERS.items():
+        response = client.post("/login", data={"username": username, "password": password})
+        tokens[role] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    connection = sqlite3.connect(os.environ["DB_NAME"])
+    failures = 0
+    for method, path, kwargs, role, allowed in SCENARIOS:
+        if method == "GET":
+            kwargs = {"params": kwargs}
+        kwargs = dict(kwargs)
+        headers = {**tokens.get(role, {}), **kwargs.pop("headers", {})}
+        captured.clear()
+        response = client.request(method, path, headers=headers, **kwargs)
+        if response.status_code >= 400:
+            print(f"ERROR {method} {path}: {response.status_code} {response.text}")
+            failures += 1
+            continue
+        for statement, parameters in captured:
+            for detail in full_scans(connection, statement, parameters, allowed):
+                failures += 1
+                print(f"FULL SCAN {method} {path}: {detail}\n    {' '.join(statement.split())}")
+        for statement, count in Counter(statement for statement, _ in captured).items():
+            if count >= settings.DB_N_PLUS_ONE_THRESHOLD:
+                failures += 1
+                print(f"N+1 {method} {path}: {count} раз\n    {' '.join(statement.split())}")
+
+    print(f"Проверено маршрутов: {len(SCENARIOS)}, проблем: {failures}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main_check())
@@ -1,8 +1,34 @@
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     DB_NAME: str = "deafult"
     SECRET_KEY: str 
+    DB_ASYNC: bool = True
+    DB_ENGINE_MODE: Literal["default", "wal"] = "wal"
+    DB_SYNCHRONOUS: str = "NORMAL"
+    DB_MMAP_SIZE: int = 256 * 1024 * 1024
+    DB_CACHE_SIZE: int = -64000
+    DB_BUSY_TIMEOUT: int = 5000
+    DB_READ_POOL_SIZE: int = 5
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL: int = 60
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    CATALOG_CACHE_SIZE: int = 2048
+    CATALOG_CACHE_TTL: int = 30
+    STREAM_BATCH_SIZE: int = 500
+    IMPORT_CHUNK_SIZE: int = 1000
+    DEBUG: bool = False
+    DB_SLOW_QUERY_MS: float = 100
+    DB_N_PLUS_ONE_THRESHOLD: int = 5
+    IDEMPOTENCY_TTL: int = 24 * 60 * 60
+    OUTBOX_ENABLED: bool = True
+    OUTBOX_SINK: Literal["file", "memory"] = "file"
+    OUTBOX_FILE: str = "outbox_events.ndjson"
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 10.0
+    OUTBOX_LEASE: int = 30
 
     model_config=SettingsConfigDict(env_file=".env")
 
@@ -1,20 +1,310 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.datastructures import MutableHeaders
 from config import settings
 
+logger = logging.getLogger(__name__)
+
+WAL_MODE = settings.DB_ENGINE_MODE == "wal"
+
+READ_METHODS = ("GET", "HEAD")
+
+def _set_sqlite_pragmas(dbapi_connection, read_only=False):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.DB_BUSY_TIMEOUT)}")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.DB_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.DB_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.DB_CACHE_SIZE)}")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def _install_pragmas(sync_engine, read_only=False):
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        _set_sqlite_pragmas(dbapi_connection, read_only)
+
+SYNC_POOL_SIZE = 5
+SYNC_MAX_OVERFLOW = 10
+
 engine = create_engine(
     f"sqlite:///./{settings.DB_NAME}",
     connect_args = {"check_same_thread": False},
+    pool_size=SYNC_POOL_SIZE,
+    max_overflow=SYNC_MAX_OVERFLOW,
 )
 
+# Синхронная сессия держит соединение и между вызовами, пока ждет свободный
+# поток. Если бы потоки пула ждали соединений, занятых такими сессиями,
+# все потоки могли бы встать. Поэтому соединение занимается только после
+# получения места в этом семафоре, еще до передачи вызова в поток.
+_sync_connection_slots = asyncio.Semaphore(SYNC_POOL_SIZE + SYNC_MAX_OVERFLOW)
+
+if WAL_MODE:
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///./{settings.DB_NAME}",
+        connect_args = {"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+    )
+    async_read_engine = create_async_engine(
+        f"sqlite+aiosqlite:///./{settings.DB_NAME}",
+        connect_args = {"check_same_thread": False},
+        pool_size=settings.DB_READ_POOL_SIZE,
+        max_overflow=0,
+    )
+    _install_pragmas(engine)
+    _install_pragmas(async_engine.sync_engine)
+    _install_pragmas(async_read_engine.sync_engine, read_only=True)
+else:
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///./{settings.DB_NAME}",
+        connect_args = {"check_same_thread": False},
+    )
+    async_read_engine = async_engine
+
+class QueryStats:
+    """Число и время SQL-запросов, выполненных при обработке одного HTTP-запроса."""
+
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def repeated(self, threshold: int) -> list:
+        return [(statement, count) for statement, count in self.statements.items() if count >= threshold]
+
+# Контекст копируется в пул потоков, поэтому синхронные сессии тоже
+# записывают запросы в статистику своего HTTP-запроса.
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+def _explain(connection, statement: str, parameters) -> str:
+    try:
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters or ())
+            return "\n".join(f"    {row[3]}" for row in cursor.fetchall())
+        finally:
+            cursor.close()
+    except Exception as error:
+        return f"    план недоступен: {error}"
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info["query_started"] = time.perf_counter()
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - connection.info.pop("query_started", time.perf_counter())
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.statements[statement] += 1
+    if elapsed * 1000 >= settings.DB_SLOW_QUERY_MS:
+        plan = "" if executemany else "\n" + _explain(connection, statement, parameters)
+        logger.warning("Медленный запрос (%.1f мс): %s%s", elapsed * 1000, " ".join(statement.split()), plan)
+
+def _install_instrumentation(sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+for _sync_engine in {engine, async_engine.sync_engine, async_read_engine.sync_engine}:
+    _install_instrumentation(_sync_engine)
+
+class QueryStatsMiddleware:
+    """Собирает статистику SQL-запросов для каждого HTTP-запроса.
+
+    Одинаковые запросы, повторенные DB_N_PLUS_ONE_THRESHOLD и более раз,
+    записываются в лог как вероятный N+1. При DEBUG=true число запросов и
+    время работы с базой добавляются в заголовки ответа.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+
+        async def send_wrapper(message):
+            if settings.DEBUG and message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Query-Count"] = str(stats.count)
+                headers["X-DB-Query-Time-Ms"] = f"{stats.seconds * 1000:.2f}"
+                headers["X-DB-Repeated-Statements"] = str(len(stats.repeated(settings.DB_N_PLUS_ONE_THRESHOLD)))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _query_stats.reset(token)
+            for statement, count in stats.repeated(settings.DB_N_PLUS_ONE_THRESHOLD):
+                logger.warning(
+                    "Вероятный N+1 в %s %s: запрос выполнен %d раз: %s",
+                    scope["method"], scope["path"], count, " ".join(statement.split()),
+                )
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_read_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+class SyncSessionAdapter:
+    """Отдает обычную Session через интерфейс AsyncSession.
+
+    Каждый вызов к базе выполняется в пуле потоков, как это делали
+    синхронные обработчики. Нужен, чтобы сравнивать пропускную способность
+    синхронного и асинхронного драйвера на одном и том же коде роутеров.
+
+    Место в _sync_connection_slots берется при первом обращении к базе и
+    освобождается, когда сессия отдает соединение (commit, rollback,
+    close), а не на все время жизни сессии. Поэтому сессия маршрута, еще
+    не выполнившая запросов, не мешает get_current_user открыть свою.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+        self._has_slot = False
+
+    async def _run(self, fn, *args, **kwargs):
+        if not self._has_slot:
+            await _sync_connection_slots.acquire()
+            self._has_slot = True
+        try:
+            return await run_in_threadpool(fn, *args, **kwargs)
+        finally:
+            if not self.sync_session.in_transaction():
+                self._release()
+
+    def _release(self):
+        if self._has_slot:
+            self._has_slot = False
+            _sync_connection_slots.release()
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, *args, **kwargs):
+        return await self._run(self.sync_session.execute, *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await self._run(self.sync_session.scalar, *args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await self._run(self.sync_session.scalars, *args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        result = await self._run(self.sync_session.execute, *args, **kwargs)
+        return _ThreadpoolResult(result)
+
+    async def get(self, *args, **kwargs):
+        return await self._run(self.sync_session.get, *args, **kwargs)
+
+    async def delete(self, instance):
+        await self._run(self.sync_session.delete, instance)
+
+    async def flush(self, *args, **kwargs):
+        await self._run(self.sync_session.flush, *args, **kwargs)
+
+    async def refresh(self, *args, **kwargs):
+        await self._run(self.sync_session.refresh, *args, **kwargs)
+
+    async def commit(self):
+        await self._run(self.sync_session.commit)
+
+    async def rollback(self):
+        await self._run(self.sync_session.rollback)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await self._run(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        if not self._has_slot:
+            # Сессия не держит соединения, закрытие не обращается к базе.
+            self.sync_session.close()
+            return
+        await self._run(self.sync_session.close)
+
+class _ThreadpoolResult:
+    """Результат синхронного запроса, который читается порциями в пуле потоков."""
+
+    def __init__(self, result):
+        self.result = result
+
+    async def partitions(self, size=None):
+        partitions = self.result.partitions(size)
+        while True:
+            partition = await run_in_threadpool(next, partitions, None)
+            if partition is None:
+                return
+            yield partition
+
+def run_migrations(revision: str = "head"):
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, revision)
+
+@asynccontextmanager
+async def _open_session(session_factory):
+    if not settings.DB_ASYNC:
+        db = SyncSessionAdapter(SessionLocal(expire_on_commit=False))
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+
+    async with session_factory() as db:
+        yield db
+
+def open_read_session():
+    return _open_session(AsyncReadSessionLocal)
+
+def open_write_session():
+    return _open_session(AsyncSessionLocal)
+
+async def get_read_db():
+    async with open_read_session() as db:
+        yield db
+
+async def get_async_db(request: Request):
+    session_factory = AsyncReadSessionLocal if request.method in READ_METHODS else AsyncSessionLocal
+    async with _open_session(session_factory) as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
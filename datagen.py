@@ -0,0 +1,358 @@
+"""Генератор синтетических данных для проверки производительности.
+
+Пересоздает базу, применяет миграции и записывает справочники, пользователей
+с логинами из README и два демонстрационных заказа (как раньше seed.py).
+Затем добавляет заданное число категорий, товаров, покупателей, заказов и
+отзывов. Популярность товаров и активность покупателей распределены по закону
+Ципфа (параметр --skew): несколько товаров собирают большую часть заказов и
+отзывов, у большинства их почти нет. Строки вставляются пачками через
+executemany, каждая пачка — одна транзакция. Пароль у всех сгенерированных
+покупателей тот же, что у пользователя «Покупатель», хеш считается один раз.
+
+    python datagen.py --products 200000 --users 100000 --orders 2000000 --reviews 1000000
+"""
+import argparse
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, UTC
+from itertools import accumulate, islice
+from typing import Callable, Dict, Iterable, Iterator, List
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Connection
+import models as m
+import passwords
+from config import settings
+import database
+from database import engine, run_migrations
+from ratings import rebuild_rating_stats
+from sales import rebuild_sales_daily
+
+ROLES = ["Покупатель", "Менеджер", "Админ"]
+STATUSES = ["новый", "в обработке", "отправлен", "доставлен", "отменён"]
+
+# (логин, email, пароль, роль); порядок задает id, на которые опираются проверки.
+USERS = [
+    ("Покупатель", "user@example.com", "user123", "Покупатель"),
+    ("Менеджер", "manager@example.com", "manag123", "Менеджер"),
+    ("Админ", "admin@example.com", "admin123", "Админ"),
+]
+
+# (название, цена, описание, остаток, категория)
+PRODUCTS = [
+    ("Смартфон Galaxy", 30000, "Современный смартфон", 10, "Телефон"),
+    ("Toshiba 5000", 25000, "Лучшая технология экрана", 50, "ТВ"),
+]
+
+# (покупатель, статус, [(товар, количество)])
+ORDERS = [
+    ("Покупатель", "новый", [("Смартфон Galaxy", 2), ("Toshiba 5000", 1)]),
+    ("Менеджер", "в обработке", [("Toshiba 5000", 3)]),
+]
+
+# Категория и диапазон цен ее товаров.
+CATEGORIES = [
+    ("Телефон", 5000, 150000),
+    ("ТВ", 10000, 300000),
+    ("Ноутбук", 30000, 400000),
+    ("Планшет", 10000, 200000),
+    ("Наушники", 1000, 60000),
+    ("Монитор", 8000, 150000),
+    ("Колонка", 1500, 80000),
+    ("Часы", 3000, 120000),
+    ("Фотоаппарат", 20000, 500000),
+    ("Холодильник", 25000, 250000),
+    ("Пылесос", 5000, 90000),
+    ("Кофемашина", 7000, 200000),
+]
+BRANDS = ["Galaxy", "Toshiba", "Lenovo", "Xiaomi", "Sony", "Philips", "Asus", "Honor", "Samsung", "Bosch"]
+WORDS = ["быстрый", "тонкий", "яркий", "легкий", "мощный", "новый", "компактный", "беспроводной", "тихий", "надежный"]
+
+# Вес числа позиций в заказе: 1, 2, 3...
+ORDER_SIZE_WEIGHTS = [50, 25, 12, 6, 4, 3]
+QUANTITIES = [1, 2, 3]
+QUANTITY_WEIGHTS = [80, 15, 5]
+# Отзывы смещены к высоким оценкам, как на реальных площадках.
+RATING_WEIGHTS = [8, 5, 10, 27, 50]
+# Статус зависит от возраста заказа: (моложе, дней) -> веса статусов.
+STATUS_BY_AGE = [
+    (1, {"новый": 6, "в обработке": 4}),
+    (7, {"в обработке": 2, "отправлен": 5, "доставлен": 3}),
+    (None, {"доставлен": 9, "отменён": 1}),
+]
+
+@dataclass
+class DatasetSize:
+    categories: int = 0
+    products: int = 0
+    users: int = 0
+    orders: int = 0
+    reviews: int = 0
+    max_items: int = 5
+    days: int = 365
+    skew: float = 1.1
+    seed: int = 1
+    batch_size: int = 50000
+
+def _batches(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+def _zipf(count: int, skew: float) -> List[float]:
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+class DataGenerator:
+    def __init__(self, connection: Connection, size: DatasetSize, log: Callable[[str], None] = print):
+        self.connection = connection
+        self.size = size
+        self.log = log
+        self.rng = random.Random(size.seed)
+        self.now = datetime.now(UTC)
+        self.counts: Dict[str, int] = {}
+
+    def insert(self, table, rows: Iterable[dict]) -> int:
+        count = 0
+        statement = insert(table)
+        for batch in _batches(rows, self.size.batch_size):
+            self.connection.execute(statement, batch)
+            self.connection.commit()
+            count += len(batch)
+        self.counts[table.__tablename__] = self.counts.get(table.__tablename__, 0) + count
+        return count
+
+    def ids(self, column, *where) -> Dict[str, int]:
+        return {name: id for id, name in self.connection.execute(select(column.class_.id, column).where(*where))}
+
+    def base(self):
+        self.insert(m.Role, [{"name": name} for name in ROLES])
+        self.insert(m.OrderStatus, [{"name": name} for name in STATUSES])
+        self.insert(m.Category, [{"name": name, "created_at": self.now} for name, _, _ in CATEGORIES[:2]])
+        roles = self.ids(m.Role.name)
+        hashes = {password: passwords.hash_password(password, settings.BCRYPT_ROUNDS) for _, _, password, _ in USERS}
+        self.insert(m.User, [
+            {"username": username, "email": email, "password": hashes[password], "role_id": roles[role], "created_at": self.now}
+            for username, email, password, role in USERS
+        ])
+        categories = self.ids(m.Category.name)
+        self.insert(m.Product, [
+            {"name": name, "price": price, "description": description, "remaining_stock": stock,
+             "category_id": categories[category], "created_at": self.now}
+            for name, price, description, stock, category in PRODUCTS
+        ])
+
+        users, statuses, products = self.ids(m.User.username), self.ids(m.OrderStatus.name), self.ids(m.Product.name)
+        prices = {name: price for name, price, *_ in PRODUCTS}
+        for username, status, items in ORDERS:
+            order_id = self.connection.execute(insert(m.Order).values(
+                user_id=users[username],
+                status_id=statuses[status],
+                total_amount=sum(prices[name] * quantity for name, quantity in items),
+                created_at=self.now,
+                updated_at=self.now,
+            )).inserted_primary_key[0]
+            self.insert(m.OrderItem, [
+                {"order_id": order_id, "product_id": products[name], "quantity": quantity, "price_at_purchase": prices[name]}
+                for name, quantity in items
+            ])
+        self.connection.commit()
+        self.buyer_hash = hashes["user123"]
+        self.buyer_role = roles["Покупатель"]
+
+    def categories(self):
+        names = [name for name, _, _ in CATEGORIES[2:]]
+        rows = (
+            {"name": names[i] if i < len(names) else f"{names[i % len(names)]} {i // len(names) + 1}", "created_at": self.now}
+            for i in range(self.size.categories)
+        )
+        self.insert(m.Category, rows)
+
+    def products(self):
+        price_ranges = {name: (low, high) for name, low, high in CATEGORIES}
+        categories = [
+            (id, name, price_ranges.get(name.split(" ")[0], (1000, 100000)))
+            for name, id in self.ids(m.Category.name).items()
+        ]
+        rng = self.rng
+
+        def rows():
+            for i in range(self.size.products):
+                category_id, name, (low, high) = rng.choice(categories)
+                yield {
+                    "name": f"{name} {rng.choice(BRANDS)} {i + 1}",
+                    # Дешевых товаров в категории больше, чем дорогих.
+                    "price": int(round(low + (high - low) * rng.random() ** 2, -1)),
+                    "description": " ".join(rng.sample(WORDS, 3)),
+                    "remaining_stock": rng.randint(0, 500),
+                    "category_id": category_id,
+                    "created_at": self.now - timedelta(days=rng.uniform(0, self.size.days)),
+                }
+
+        self.insert(m.Product, rows())
+
+    def users(self):
+        rows = (
+            {
+                "username": f"user{i + 1}",
+                "email": f"user{i + 1}@example.com",
+                "password": self.buyer_hash,
+                "role_id": self.buyer_role,
+                "created_at": self.now - timedelta(days=self.rng.uniform(0, self.size.days)),
+            }
+            for i in range(self.size.users)
+        )
+        self.insert(m.User, rows)
+
+    def load_population(self):
+        rng = self.rng
+        # Ранг популярности не совпадает с id, иначе популярными были бы
+        # только старые товары.
+        self.products_by_rank = list(self.connection.execute(select(m.Product.id, m.Product.price)))
+        rng.shuffle(self.products_by_rank)
+        self.product_weights = _zipf(len(self.products_by_rank), self.size.skew)
+        self.buyers = list(self.connection.scalars(select(m.User.id).where(m.User.role_id == self.buyer_role)))
+        rng.shuffle(self.buyers)
+        self.buyer_weights = _zipf(len(self.buyers), self.size.skew)
+
+    def orders(self):
+        size, rng = self.size, self.rng
+        if not size.orders or not self.products_by_rank:
+            return
+        statuses = self.ids(m.OrderStatus.name)
+        status_by_age = [
+            (days, [statuses[name] for name in weights], list(accumulate(weights.values())))
+            for days, weights in STATUS_BY_AGE
+        ]
+        order_sizes = list(range(1, size.max_items + 1))
+        size_weights = list(accumulate((ORDER_SIZE_WEIGHTS + [1] * size.max_items)[:size.max_items]))
+        quantity_weights = list(accumulate(QUANTITY_WEIGHTS))
+        first_id = (self.connection.scalar(select(m.Order.id).order_by(m.Order.id.desc()).limit(1)) or 0) + 1
+        start = self.now - timedelta(days=size.days)
+        step = timedelta(days=size.days) / size.orders
+        items: List[dict] = []
+
+        def rows():
+            # Id заказов растут вместе с датой создания.
+            for i in range(size.orders):
+                order_id = first_id + i
+                created_at = start + step * i
+                age = (self.now - created_at).days
+                for days, status_ids, weights in status_by_age:
+                    if days is None or age < days:
+                        break
+                count = rng.choices(order_sizes, cum_weights=size_weights)[0]
+                picked = dict(rng.choices(self.products_by_rank, cum_weights=self.product_weights, k=count))
+                total = 0
+                for product_id, price in picked.items():
+                    quantity = rng.choices(QUANTITIES, cum_weights=quantity_weights)[0]
+                    total += price * quantity
+                    items.append({"order_id": order_id, "product_id": product_id, "quantity": quantity, "price_at_purchase": price})
+                yield {
+                    "id": order_id,
+                    "user_id": rng.choices(self.buyers, cum_weights=self.buyer_weights)[0],
+                    "status_id": rng.choices(status_ids, cum_weights=weights)[0],
+                    "total_amount": total,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                }
+
+        # Позиции пачки заказов пишутся сразу после самих заказов.
+        for batch in _batches(rows(), size.batch_size):
+            self.insert(m.Order, batch)
+            self.insert(m.OrderItem, items)
+            items.clear()
+
+    def sales(self):
+        # Дневные продажи считаются одним запросом по уже записанным заказам.
+        rebuild_sales_daily(self.connection)
+        self.connection.commit()
+        self.counts[m.SalesDaily.__tablename__] = self.connection.scalar(select(func.count()).select_from(m.SalesDaily))
+
+    def reviews(self):
+        size, rng = self.size, self.rng
+        if not size.reviews or not self.products_by_rank or not self.buyers:
+            return
+        # Число отзывов товара пропорционально его популярности, автор
+        # оставляет на товар не больше одного отзыва.
+        total_weight = self.product_weights[-1]
+        rating_values = list(range(1, 6))
+        rating_weights = list(accumulate(RATING_WEIGHTS))
+
+        def rows():
+            previous = 0.0
+            for (product_id, _), cumulative in zip(self.products_by_rank, self.product_weights):
+                share = (cumulative - previous) / total_weight
+                previous = cumulative
+                count = min(len(self.buyers), int(size.reviews * share + rng.random()))
+                for user_id in rng.sample(self.buyers, count):
+                    created_at = self.now - timedelta(days=rng.uniform(0, size.days))
+                    yield {
+                        "product_id": product_id,
+                        "user_id": user_id,
+                        "rating": rng.choices(rating_values, cum_weights=rating_weights)[0],
+                        "text": " ".join(rng.sample(WORDS, 2)),
+                        "created_at": created_at,
+                        "updated_at": created_at,
+                    }
+
+        self.insert(m.Review, rows())
+        rebuild_rating_stats(self.connection)
+        self.connection.commit()
+
+    def run(self) -> Dict[str, int]:
+        started = time.perf_counter()
+        self.base()
+        self.log(f"Справочники и пользователи из README: {time.perf_counter() - started:.1f} с")
+        for step in [self.categories, self.products, self.users, self.load_population, self.orders, self.sales, self.reviews]:
+            before = dict(self.counts)
+            started = time.perf_counter()
+            step()
+            seconds = time.perf_counter() - started
+            for table, count in self.counts.items():
+                added = count - before.get(table, 0)
+                if added:
+                    self.log(f"{table}: {added} строк за {seconds:.1f} с ({added / seconds:,.0f} строк/с)")
+        return self.counts
+
+def reset_database():
+    m.Base.metadata.drop_all(bind=engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE IF EXISTS alembic_version")
+    run_migrations()
+
+def generate(size: DatasetSize, log: Callable[[str], None] = print) -> Dict[str, int]:
+    reset_database()
+    # Пачка executemany почти всегда дольше DB_SLOW_QUERY_MS, предупреждения
+    # о медленных запросах здесь бесполезны.
+    database_logger = logging.getLogger(database.__name__)
+    level = database_logger.level
+    database_logger.setLevel(logging.ERROR)
+    with engine.connect() as connection:
+        # База создается заново: при сбое генерацию проще повторить,
+        # поэтому ожидание записи на диск не нужно.
+        connection.exec_driver_sql("PRAGMA synchronous=OFF")
+        try:
+            return DataGenerator(connection, size, log).run()
+        finally:
+            connection.exec_driver_sql(f"PRAGMA synchronous={settings.DB_SYNCHRONOUS}")
+            database_logger.setLevel(level)
+
+if __name__ == "__main__":
+    defaults = DatasetSize()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--categories", type=int, default=10, help="категорий сверх двух базовых")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--reviews", type=int, default=20000)
+    parser.add_argument("--max-items", type=int, default=defaults.max_items, help="наибольшее число позиций в заказе")
+    parser.add_argument("--days", type=int, default=defaults.days, help="за сколько дней распределены даты")
+    parser.add_argument("--skew", type=float, default=defaults.skew, help="показатель распределения Ципфа")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size, help="строк в одной транзакции")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate(DatasetSize(**vars(args)))
+    print(f"Всего {sum(counts.values())} строк за {time.perf_counter() - started:.1f} с")
@@ -0,0 +1,58 @@
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from fastapi import HTTPException
+
+class FieldSet:
+    """Поля списка, которые клиент выбирает параметром fields=id,name,price.
+
+    Каждому полю соответствуют столбцы SELECT и функция, собирающая из их
+    значений поле ответа. Поле без столбцов (например, позиции заказа)
+    заполняет вызывающий код.
+    """
+
+    def __init__(self, fields: Dict[str, Tuple[tuple, Optional[Callable]]]):
+        self.fields = fields
+        self.names = tuple(fields)
+
+    def parse(self, value: Optional[str]) -> Optional[Tuple[str, ...]]:
+        """Возвращает выбранные поля в порядке модели или None, если нужны все."""
+        if value is None:
+            return None
+        names = {name.strip() for name in value.split(",") if name.strip()}
+        unknown = sorted(names - self.fields.keys())
+        if unknown or not names:
+            raise HTTPException(
+                status_code=400,
+                detail={"message": "Неизвестные поля в fields", "fields": unknown, "allowed": list(self.fields)},
+            )
+        if len(names) == len(self.fields):
+            return None
+        return self.ordered(names)
+
+    def ordered(self, names: Iterable[str]) -> Tuple[str, ...]:
+        names = set(names)
+        return tuple(name for name in self.fields if name in names)
+
+    def columns(self, names: Sequence[str]) -> list:
+        return [column for name in names for column in self.fields[name][0]]
+
+    def builder(self, names: Sequence[str]) -> Callable[[Sequence], dict]:
+        """Функция, которая собирает словарь из строки select(*columns(names))."""
+        plan = []
+        start = 0
+        for name in names:
+            columns, convert = self.fields[name]
+            if not columns:
+                continue
+            plan.append((name, start, start + len(columns), convert))
+            start += len(columns)
+
+        def build(row: Sequence) -> dict:
+            return {
+                name: convert(*row[begin:end]) if convert else row[begin]
+                for name, begin, end, convert in plan
+            }
+        return build
+
+def strip_fields(rows: List[dict], names: Sequence[str]) -> List[dict]:
+    """Убирает поля, которые загружались только для курсора или сортировки."""
+    return [{name: row[name] for name in names} for row in rows]
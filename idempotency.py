@@ -0,0 +1,83 @@
+import hashlib
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Optional
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import models as m
+from config import settings
+
+keys = m.IdempotencyKey.__table__
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Как часто удалять просроченные ключи, в секундах.
+PURGE_INTERVAL = 600
+_next_purge = 0.0
+
+class IdempotentRequest:
+    """Запрос с заголовком Idempotency-Key.
+
+    Ключ действует в пределах пользователя. Ответ сохраняется в той же
+    транзакции, что и изменения, поэтому повтор либо находит готовый ответ,
+    либо выполняется заново, если первая попытка не дошла до коммита.
+    Повтор с тем же ключом и другим телом или для другой операции получает 422.
+    """
+
+    def __init__(self, user_id: int, key: str, scope: str, payload: BaseModel):
+        self.user_id = user_id
+        self.key = key
+        self.request_hash = hashlib.sha256(
+            scope.encode("utf-8") + b"\n" + payload.model_dump_json().encode("utf-8")
+        ).hexdigest()
+
+    async def replay(self, db: AsyncSession) -> Optional[Response]:
+        row = (await db.execute(
+            select(keys.c.request_hash, keys.c.status_code, keys.c.response_body)
+            .where(keys.c.user_id == self.user_id, keys.c.key == self.key, keys.c.expires_at > datetime.now(UTC))
+        )).first()
+        if row is None:
+            return None
+        if row.request_hash != self.request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key уже использован для другого запроса")
+        return self.response(row.response_body, row.status_code, replayed=True)
+
+    async def remember(self, db: AsyncSession, body: bytes, status_code: int = 200) -> bool:
+        """Сохраняет ответ в текущей транзакции.
+
+        Просроченная запись с тем же ключом перезаписывается. False значит,
+        что параллельный запрос с этим ключом уже сохранил свой ответ.
+        """
+        now = datetime.now(UTC)
+        statement = insert(keys).values(
+            user_id=self.user_id,
+            key=self.key,
+            request_hash=self.request_hash,
+            status_code=status_code,
+            response_body=body,
+            created_at=now,
+            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL),
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[keys.c.user_id, keys.c.key],
+            set_={name: statement.excluded[name] for name in
+                  ("request_hash", "status_code", "response_body", "created_at", "expires_at")},
+            where=keys.c.expires_at <= now,
+        )
+        result = await db.execute(statement)
+        await _purge_expired(db, now)
+        return result.rowcount == 1
+
+    def response(self, body: bytes, status_code: int = 200, replayed: bool = False) -> Response:
+        headers = {REPLAYED_HEADER: "true"} if replayed else None
+        return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+async def _purge_expired(db: AsyncSession, now: datetime):
+    global _next_purge
+    if time.monotonic() < _next_purge:
+        return
+    _next_purge = time.monotonic() + PURGE_INTERVAL
+    await db.execute(delete(keys).where(keys.c.expires_at <= now))
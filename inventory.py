@@ -0,0 +1,92 @@
+from typing import Dict, Iterable
+from fastapi import HTTPException
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import models as m
+
+products = m.Product.__table__
+
+# Изменение остатка увеличивает версию товара: редактирование с версией,
+# прочитанной до списания, получит 409 и не затрет остаток.
+_reserve_stmt = (
+    update(products)
+    .where(products.c.id == bindparam("pid"), products.c.remaining_stock >= bindparam("qty"))
+    .values(remaining_stock=products.c.remaining_stock - bindparam("qty"), version=products.c.version + 1)
+)
+
+_release_stmt = (
+    update(products)
+    .where(products.c.id == bindparam("pid"))
+    .values(remaining_stock=products.c.remaining_stock + bindparam("qty"), version=products.c.version + 1)
+)
+
+def merge_quantities(items: Iterable) -> Dict[int, int]:
+    quantities: Dict[int, int] = {}
+    for item in items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+async def load_products(db: AsyncSession, product_ids: Iterable[int]) -> dict:
+    rows = await db.execute(
+        select(products.c.id, products.c.name, products.c.price, products.c.remaining_stock)
+        .where(products.c.id.in_(list(product_ids)))
+    )
+    return {row.id: row for row in rows}
+
+async def _shortages(db: AsyncSession, quantities: Dict[int, int]) -> list:
+    current = await load_products(db, quantities)
+    return [
+        {
+            "product_id": product_id,
+            "name": current[product_id].name,
+            "requested": quantity,
+            "available": float(current[product_id].remaining_stock or 0),
+        }
+        for product_id, quantity in quantities.items()
+        if product_id in current
+        and (current[product_id].remaining_stock is None or current[product_id].remaining_stock < quantity)
+    ]
+
+async def find_products(db: AsyncSession, quantities: Dict[int, int]) -> dict:
+    """Товары позиций заказа с ценами, 404 если какого-то товара нет.
+
+    Остаток здесь не проверяется, поэтому читать можно через пул чтения:
+    его проверяет условный UPDATE в reserve_stock.
+    """
+    found = await load_products(db, quantities) if quantities else {}
+    for product_id in quantities:
+        if product_id not in found:
+            raise HTTPException(status_code=404, detail=f"Товар ID {product_id} не найден")
+    return found
+
+async def reserve_stock(db: AsyncSession, quantities: Dict[int, int]):
+    """Списывает остатки по всем позициям заказа.
+
+    Остатки уменьшаются условными UPDATE ... WHERE remaining_stock >= :qty
+    в текущей транзакции. Если хотя бы одной позиции не хватает, транзакция
+    откатывается и возвращается 400 со списком недостающих товаров.
+    """
+    if not quantities:
+        return
+    result = await db.execute(
+        _reserve_stmt,
+        [{"pid": product_id, "qty": quantity} for product_id, quantity in quantities.items()],
+    )
+    if result.rowcount == len(quantities):
+        return
+
+    await db.rollback()
+    shortages = await _shortages(db, quantities)
+    if not shortages:
+        raise HTTPException(status_code=409, detail="Остатки товаров изменились, повторите запрос")
+    raise HTTPException(
+        status_code=400,
+        detail={"message": "Недостаточно товара на складе", "items": shortages},
+    )
+
+async def release_stock(db: AsyncSession, quantities: Dict[int, int]):
+    if quantities:
+        await db.execute(
+            _release_stmt,
+            [{"pid": product_id, "qty": quantity} for product_id, quantity in quantities.items()],
+        )
@@ -1,11 +1,30 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from routers import *
+from metrics import MetricsMiddleware
+from database import QueryStatsMiddleware
+from config import settings
+from outbox import OutboxWorker, make_sink
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker = OutboxWorker(make_sink(settings.OUTBOX_SINK)) if settings.OUTBOX_ENABLED else None
+    app.state.outbox_worker = worker
+    if worker is not None:
+        worker.start()
+    yield
+    if worker is not None:
+        await worker.stop()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(user_router, prefix="/api", tags=["api"])
 app.include_router(product_router, prefix="/api", tags=["api"])
 app.include_router(auth_router)
 app.include_router(orders_router, prefix="/api", tags=["api"])
 app.include_router(review_router, prefix="/api", tags=["api"])
-app.include_router(category_router, prefix="/api", tags=["api"])
\ No newline at end of file
+app.include_router(category_router, prefix="/api", tags=["api"])
+app.include_router(analytics_router, prefix="/api", tags=["api"])
+app.include_router(metrics_router)
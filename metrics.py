@@ -0,0 +1,144 @@
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+from starlette.routing import NoMatchFound
+
+# Границы корзин гистограммы задержек в секундах (как у клиентов Prometheus).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _route_template(route, scope) -> str:
+    # Маршрут в scope["route"] может не содержать префиксов include_router
+    # (/api и т.п.). Путь маршрута подставляется с параметрами этого запроса,
+    # а все, что стоит перед ним в пути запроса, и есть префикс.
+    path_params = scope.get("path_params", {})
+    try:
+        own_path = route.url_path_for(
+            route.name, **{name: path_params[name] for name in route.param_convertors}
+        )
+    except (NoMatchFound, KeyError):
+        return route.path
+    if not scope["path"].endswith(own_path):
+        return route.path
+    return scope["path"][:len(scope["path"]) - len(own_path)] + route.path
+
+class Histogram:
+    """Гистограмма задержек с заранее выделенными счетчиками корзин.
+
+    Строки меток собираются один раз при создании, запись наблюдения
+    только увеличивает счетчики.
+    """
+
+    __slots__ = ("labels", "bucket_labels", "counts", "total", "count")
+
+    def __init__(self, labels: str):
+        self.labels = labels
+        self.bucket_labels = [f'{labels},le="{bound}"' for bound in BUCKETS] + [f'{labels},le="+Inf"']
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def render(self, name: str, lines: List[str]):
+        cumulative = 0
+        for labels, count in zip(self.bucket_labels, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{{{labels}}} {cumulative}")
+        lines.append(f"{name}_sum{{{self.labels}}} {self.total}")
+        lines.append(f"{name}_count{{{self.labels}}} {self.count}")
+
+class RouteMetrics:
+    __slots__ = ("labels", "by_status")
+
+    def __init__(self, method: str, route: str):
+        self.labels = f'method="{_escape(method)}",route="{_escape(route)}"'
+        self.by_status: Dict[int, Histogram] = {}
+
+    def observe(self, status: int, seconds: float):
+        histogram = self.by_status.get(status)
+        if histogram is None:
+            histogram = self.by_status[status] = Histogram(f'{self.labels},status="{status}"')
+        histogram.observe(seconds)
+
+class MetricsRegistry:
+    def __init__(self):
+        # Ключ — (метод, id объекта маршрута): маршруты живут все время
+        # работы приложения, а APIRoute не хешируется.
+        self.routes: Dict[Tuple[str, int], RouteMetrics] = {}
+        # Маршрут становится известен только после маршрутизации, поэтому
+        # запросы в обработке считаются по HTTP-методу.
+        self.in_flight: Dict[str, int] = {}
+
+    def route(self, method: str, route, scope) -> RouteMetrics:
+        key = (method, id(route))
+        metrics = self.routes.get(key)
+        if metrics is None:
+            template = _route_template(route, scope) if getattr(route, "path", None) else UNMATCHED_ROUTE
+            metrics = self.routes[key] = RouteMetrics(method, template)
+        return metrics
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_request_duration_seconds Время обработки HTTP-запроса.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        routes = sorted(self.routes.values(), key=lambda metrics: metrics.labels)
+        for metrics in routes:
+            for status in sorted(metrics.by_status):
+                metrics.by_status[status].render("http_request_duration_seconds", lines)
+        lines += [
+            "# HELP http_requests_in_flight Запросы, которые обрабатываются сейчас.",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        lines += [
+            f'http_requests_in_flight{{method="{_escape(method)}"}} {count}'
+            for method, count in sorted(self.in_flight.items())
+        ]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+class MetricsMiddleware:
+    """ASGI-middleware, которое замеряет время каждого HTTP-запроса.
+
+    Маршрут берется из scope["route"], который заполняет роутер, поэтому
+    запросы с разными id попадают в одну серию (/api/product/{product_id}).
+    Время считается до отправки последнего фрагмента тела, включая потоковые
+    ответы.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry.in_flight[method] = registry.in_flight.get(method, 0) + 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.in_flight[method] -= 1
+            route_metrics = registry.route(method, scope.get("route"), scope)
+            route_metrics.observe(status, time.perf_counter() - started)
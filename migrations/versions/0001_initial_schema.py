@@ -0,0 +1,86 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "roles",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(50), nullable=False, unique=True),
+    )
+    op.create_table(
+        "order_statuses",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(50), nullable=False, unique=True),
+    )
+    op.create_table(
+        "categories",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False, unique=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(150), nullable=False, unique=True),
+        sa.Column("email", sa.String(255), nullable=False, unique=True),
+        sa.Column("password", sa.String(255), nullable=False),
+        sa.Column("role_id", sa.Integer(), sa.ForeignKey("roles.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(255), nullable=False, unique=True),
+        sa.Column("price", sa.Numeric(), nullable=False),
+        sa.Column("description", sa.String(255), nullable=True),
+        sa.Column("remaining_stock", sa.Numeric(), nullable=True),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("status_id", sa.Integer(), sa.ForeignKey("order_statuses.id"), nullable=False),
+        sa.Column("total_amount", sa.Numeric(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        "order_items",
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id"), primary_key=True),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), primary_key=True),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("price_at_purchase", sa.Numeric(), nullable=False),
+    )
+    op.create_table(
+        "reviews",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("rating", sa.Integer(), nullable=False),
+        sa.Column("text", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+
+def downgrade():
+    op.drop_table("reviews")
+    op.drop_table("order_items")
+    op.drop_table("orders")
+    op.drop_table("products")
+    op.drop_table("users")
+    op.drop_table("categories")
+    op.drop_table("order_statuses")
+    op.drop_table("roles")
@@ -0,0 +1,48 @@
+"""products full-text search
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:10:00
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# SQL зафиксирован на момент миграции: последующие правки models.py
+# не должны менять схему, которую она создает.
+PRODUCTS_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(name, description, "
+    "content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN INSERT INTO "
+    "products_fts(rowid, name, description) VALUES (new.id, replace(replace(new.name, 'ё', "
+    "'е'), 'Ё', 'Е'), replace(replace(new.description, 'ё', 'е'), 'Ё', 'Е')); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN INSERT INTO "
+    "products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, "
+    "replace(replace(old.name, 'ё', 'е'), 'Ё', 'Е'), replace(replace(old.description, 'ё', "
+    "'е'), 'Ё', 'Е')); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products"
+    " BEGIN INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', "
+    "old.id, replace(replace(old.name, 'ё', 'е'), 'Ё', 'Е'), replace(replace(old.description, "
+    "'ё', 'е'), 'Ё', 'Е')); INSERT INTO products_fts(rowid, name, description) VALUES (new.id, "
+    "replace(replace(new.name, 'ё', 'е'), 'Ё', 'Е'), replace(replace(new.description, 'ё', "
+    "'е'), 'Ё', 'Е')); END",
+]
+
+PRODUCTS_FTS_REBUILD = [
+    "INSERT INTO products_fts(products_fts) VALUES ('delete-all')",
+    "INSERT INTO products_fts(rowid, name, description) SELECT id, replace(replace(name, 'ё', "
+    "'е'), 'Ё', 'Е'), replace(replace(description, 'ё', 'е'), 'Ё', 'Е') FROM products",
+]
+
+def upgrade():
+    for statement in PRODUCTS_FTS_DDL + PRODUCTS_FTS_REBUILD:
+        op.execute(statement)
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS products_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS products_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS products_fts_ai")
+    op.execute("DROP TABLE IF EXISTS products_fts")
@@ -0,0 +1,30 @@
+"""indexes for hot query columns
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 10:20:00
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index("ix_products_category_price", "products", ["category_id", "price"])
+    op.create_index("ix_products_price", "products", ["price"])
+    op.create_index("ix_orders_user_id", "orders", ["user_id"])
+    op.create_index("ix_orders_status_created", "orders", ["status_id", "created_at"])
+    op.create_index("ix_order_items_product_id", "order_items", ["product_id"])
+    op.create_index("ux_reviews_product_user", "reviews", ["product_id", "user_id"], unique=True)
+    op.create_index("ix_reviews_user_id", "reviews", ["user_id"])
+
+def downgrade():
+    op.drop_index("ix_reviews_user_id", "reviews")
+    op.drop_index("ux_reviews_product_user", "reviews")
+    op.drop_index("ix_order_items_product_id", "order_items")
+    op.drop_index("ix_orders_status_created", "orders")
+    op.drop_index("ix_orders_user_id", "orders")
+    op.drop_index("ix_products_price", "products")
+    op.drop_index("ix_products_category_price", "products")
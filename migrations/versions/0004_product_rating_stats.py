@@ -0,0 +1,53 @@
+"""product rating aggregates
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 10:30:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# Триггеры и пересчет в том виде, в каком они были при выпуске миграции.
+PRODUCT_RATING_STATS_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS product_rating_stats_ai AFTER INSERT ON products BEGIN INSERT"
+    " OR IGNORE INTO product_rating_stats(product_id) VALUES (new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS product_rating_stats_ad AFTER DELETE ON products BEGIN DELETE"
+    " FROM product_rating_stats WHERE product_id = old.id; END",
+]
+
+PRODUCT_RATING_STATS_REBUILD = [
+    "DELETE FROM product_rating_stats",
+    "INSERT INTO product_rating_stats (product_id, rating_count, rating_sum, rating_avg, "
+    "stars_1, stars_2, stars_3, stars_4, stars_5) SELECT p.id, count(r.id), "
+    "coalesce(sum(r.rating), 0), coalesce(avg(r.rating), 0), coalesce(sum(r.rating = 1), 0), "
+    "coalesce(sum(r.rating = 2), 0), coalesce(sum(r.rating = 3), 0), coalesce(sum(r.rating = "
+    "4), 0), coalesce(sum(r.rating = 5), 0) FROM products p LEFT JOIN reviews r ON r.product_id"
+    " = p.id GROUP BY p.id",
+]
+
+def upgrade():
+    op.create_table(
+        "product_rating_stats",
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), primary_key=True),
+        sa.Column("rating_count", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("rating_sum", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("rating_avg", sa.Float(), nullable=False, server_default=sa.text("0")),
+        *[
+            sa.Column(f"stars_{star}", sa.Integer(), nullable=False, server_default=sa.text("0"))
+            for star in range(1, 6)
+        ],
+    )
+    op.create_index("ix_product_rating_stats_avg", "product_rating_stats", ["rating_avg", "product_id"])
+    for statement in PRODUCT_RATING_STATS_DDL + PRODUCT_RATING_STATS_REBUILD:
+        op.execute(statement)
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS product_rating_stats_ad")
+    op.execute("DROP TRIGGER IF EXISTS product_rating_stats_ai")
+    op.drop_index("ix_product_rating_stats_avg", "product_rating_stats")
+    op.drop_table("product_rating_stats")
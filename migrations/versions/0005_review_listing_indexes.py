@@ -0,0 +1,20 @@
+"""indexes for review listing by product
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 10:40:00
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index("ix_reviews_product_created", "reviews", ["product_id", "created_at"])
+    op.create_index("ix_reviews_product_rating", "reviews", ["product_id", "rating"])
+
+def downgrade():
+    op.drop_index("ix_reviews_product_rating", "reviews")
+    op.drop_index("ix_reviews_product_created", "reviews")
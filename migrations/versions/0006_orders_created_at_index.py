@@ -0,0 +1,18 @@
+"""index for order export by date
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 10:50:00
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index("ix_orders_created_at", "orders", ["created_at"])
+
+def downgrade():
+    op.drop_index("ix_orders_created_at", "orders")
@@ -0,0 +1,21 @@
+"""version columns for optimistic concurrency
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 11:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("products", sa.Column("version", sa.Integer(), nullable=False, server_default=sa.text("1")))
+    op.add_column("orders", sa.Column("version", sa.Integer(), nullable=False, server_default=sa.text("1")))
+
+def downgrade():
+    op.drop_column("orders", "version")
+    op.drop_column("products", "version")
@@ -0,0 +1,30 @@
+"""stored responses for Idempotency-Key
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 11:10:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("key", sa.String(255), primary_key=True),
+        sa.Column("request_hash", sa.String(64), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=False),
+        sa.Column("response_body", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_idempotency_keys_expires_at", "idempotency_keys", ["expires_at"])
+
+def downgrade():
+    op.drop_index("ix_idempotency_keys_expires_at", "idempotency_keys")
+    op.drop_table("idempotency_keys")
@@ -0,0 +1,28 @@
+"""transactional outbox for order events
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 11:20:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "outbox_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("event_type", sa.String(50), nullable=False),
+        sa.Column("order_id", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("locked_until", sa.DateTime(), nullable=True),
+        sqlite_autoincrement=True,
+    )
+
+def downgrade():
+    op.drop_table("outbox_events")
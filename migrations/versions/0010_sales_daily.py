@@ -0,0 +1,50 @@
+"""daily sales rollups
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 11:30:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+# Копия SQL из models.py на момент миграции.
+SALES_DAILY_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS sales_daily_category_au AFTER UPDATE OF category_id ON "
+    "products WHEN new.category_id IS NOT old.category_id BEGIN UPDATE sales_daily SET "
+    "category_id = new.category_id WHERE product_id = new.id; END",
+]
+
+SALES_DAILY_REBUILD = [
+    "DELETE FROM sales_daily",
+    "INSERT INTO sales_daily (day, product_id, category_id, units, revenue, item_count) SELECT "
+    "date(o.created_at), i.product_id, p.category_id, sum(i.quantity), sum(i.quantity * "
+    "i.price_at_purchase), count(*) FROM order_items i JOIN orders o ON o.id = i.order_id JOIN "
+    "products p ON p.id = i.product_id GROUP BY date(o.created_at), i.product_id",
+]
+
+def upgrade():
+    op.create_table(
+        "sales_daily",
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("product_id", sa.Integer(), primary_key=True),
+        sa.Column("category_id", sa.Integer(), nullable=False),
+        sa.Column("units", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("revenue", sa.Numeric(), nullable=False, server_default=sa.text("0")),
+        sa.Column("item_count", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sqlite_with_rowid=False,
+    )
+    op.create_index("ix_sales_daily_category_day", "sales_daily", ["category_id", "day", "units", "revenue", "item_count"])
+    op.create_index("ix_sales_daily_product_day", "sales_daily", ["product_id", "day", "units", "revenue", "item_count"])
+    for statement in SALES_DAILY_DDL + SALES_DAILY_REBUILD:
+        op.execute(statement)
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS sales_daily_category_au")
+    op.drop_index("ix_sales_daily_product_day", "sales_daily")
+    op.drop_index("ix_sales_daily_category_day", "sales_daily")
+    op.drop_table("sales_daily")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, Numeric, Float, ForeignKey, Date, DateTime, Text, LargeBinary, DDL, Index, event, text
 from sqlalchemy.orm import relationship
 from datetime import datetime, UTC
 from database import Base
@@ -44,10 +44,18 @@ class Product(Base):
     remaining_stock = Column(Numeric, nullable=True)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.now(UTC))
+    # Увеличивается при каждом изменении, включая списание остатков.
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"))
 
     category = relationship("Category", back_populates="products")
     reviews = relationship("Review", back_populates="product")
     order_items = relationship("OrderItem", back_populates="product")
+    rating = relationship("ProductRatingStats", uselist=False, lazy="joined", viewonly=True)
+
+    __table_args__ = (
+        Index("ix_products_category_price", "category_id", "price"),
+        Index("ix_products_price", "price"),
+    )
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -60,6 +68,10 @@ class OrderItem(Base):
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
 
+    __table_args__ = (
+        Index("ix_order_items_product_id", "product_id"),
+    )
+
 class OrderStatus(Base):
     __tablename__ = "order_statuses"
 
@@ -75,13 +87,20 @@ class Order(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     status_id = Column(Integer, ForeignKey("order_statuses.id"), nullable=False)
     total_amount = Column(Numeric, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(UTC))
-    updated_at = Column(DateTime, default=datetime.now(UTC), onupdate=datetime.now(UTC))
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    updated_at = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"))
 
     user = relationship("User", back_populates="orders")
     status = relationship("OrderStatus", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_orders_user_id", "user_id"),
+        Index("ix_orders_status_created", "status_id", "created_at"),
+        Index("ix_orders_created_at", "created_at"),
+    )
+
 class Review(Base):
     __tablename__ = "reviews"
 
@@ -90,8 +109,170 @@ class Review(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     rating = Column(Integer, nullable=False)
     text = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.now(UTC))
-    updated_at = Column(DateTime, default=datetime.now(UTC), onupdate=datetime.now(UTC))
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    updated_at = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
 
     product = relationship("Product", back_populates="reviews")
     user = relationship("User", back_populates="reviews")
+
+    __table_args__ = (
+        Index("ux_reviews_product_user", "product_id", "user_id", unique=True),
+        Index("ix_reviews_user_id", "user_id"),
+        Index("ix_reviews_product_created", "product_id", "created_at"),
+        Index("ix_reviews_product_rating", "product_id", "rating"),
+    )
+
+class ProductRatingStats(Base):
+    __tablename__ = "product_rating_stats"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    rating_sum = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    rating_avg = Column(Float, nullable=False, default=0, server_default=text("0"))
+    stars_1 = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    stars_2 = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    stars_3 = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    stars_4 = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    stars_5 = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+    __table_args__ = (
+        Index("ix_product_rating_stats_avg", "rating_avg", "product_id"),
+    )
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String(50), nullable=False)
+    order_id = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    # Пока не истекло, событие считается взятым обработчиком.
+    locked_until = Column(DateTime, nullable=True)
+
+    # Доставленные события удаляются; AUTOINCREMENT не дает id повториться,
+    # потребители могут отбрасывать повторы по id.
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class SalesDaily(Base):
+    __tablename__ = "sales_daily"
+
+    # Без внешних ключей: продажи удаленного товара остаются в истории.
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, nullable=False)
+    units = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    revenue = Column(Numeric, nullable=False, default=0, server_default=text("0"))
+    # Число позиций заказов: заказ считается один раз в строке товара.
+    item_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+    # Таблица хранится в порядке (день, товар), а индексы включают суммы:
+    # запросы за период читают только индекс, не обращаясь к строкам.
+    __table_args__ = (
+        Index("ix_sales_daily_category_day", "category_id", "day", "units", "revenue", "item_count"),
+        Index("ix_sales_daily_product_day", "product_id", "day", "units", "revenue", "item_count"),
+        {"sqlite_with_rowid": False},
+    )
+
+def _fts_text(expr):
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+PRODUCTS_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, description, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, description) "
+    f"VALUES (new.id, {_fts_text('new.name')}, {_fts_text('new.description')}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) "
+    f"VALUES ('delete', old.id, {_fts_text('old.name')}, {_fts_text('old.description')}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) "
+    f"VALUES ('delete', old.id, {_fts_text('old.name')}, {_fts_text('old.description')}); "
+    "INSERT INTO products_fts(rowid, name, description) "
+    f"VALUES (new.id, {_fts_text('new.name')}, {_fts_text('new.description')}); "
+    "END",
+]
+
+PRODUCTS_FTS_REBUILD = [
+    "INSERT INTO products_fts(products_fts) VALUES ('delete-all')",
+    "INSERT INTO products_fts(rowid, name, description) "
+    f"SELECT id, {_fts_text('name')}, {_fts_text('description')} FROM products",
+]
+
+for statement in PRODUCTS_FTS_DDL + PRODUCTS_FTS_REBUILD:
+    event.listen(Product.__table__, "after_create", DDL(statement))
+
+event.listen(Product.__table__, "before_drop", DDL("DROP TABLE IF EXISTS products_fts"))
+
+# Строка статистики есть у каждого товара, поэтому сортировка по рейтингу
+# идет по индексу ix_product_rating_stats_avg без внешнего соединения.
+PRODUCT_RATING_STATS_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS product_rating_stats_ai AFTER INSERT ON products BEGIN "
+    "INSERT OR IGNORE INTO product_rating_stats(product_id) VALUES (new.id); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS product_rating_stats_ad AFTER DELETE ON products BEGIN "
+    "DELETE FROM product_rating_stats WHERE product_id = old.id; "
+    "END",
+]
+
+PRODUCT_RATING_STATS_REBUILD = [
+    "DELETE FROM product_rating_stats",
+    "INSERT INTO product_rating_stats "
+    "(product_id, rating_count, rating_sum, rating_avg, stars_1, stars_2, stars_3, stars_4, stars_5) "
+    "SELECT p.id, count(r.id), coalesce(sum(r.rating), 0), coalesce(avg(r.rating), 0), "
+    + ", ".join(f"coalesce(sum(r.rating = {star}), 0)" for star in range(1, 6)) + " "
+    "FROM products p LEFT JOIN reviews r ON r.product_id = p.id GROUP BY p.id",
+]
+
+for statement in PRODUCT_RATING_STATS_DDL:
+    event.listen(ProductRatingStats.__table__, "after_create", DDL(statement))
+
+# Продажи товара всегда лежат в его текущей категории, как и при пересчете.
+# Триггер висит на products, поэтому создается вместе с ней: у sales_daily
+# нет внешних ключей, и create_all может создать ее раньше products.
+SALES_DAILY_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS sales_daily_category_au AFTER UPDATE OF category_id ON products "
+    "WHEN new.category_id IS NOT old.category_id BEGIN "
+    "UPDATE sales_daily SET category_id = new.category_id WHERE product_id = new.id; "
+    "END",
+]
+
+# Товар мог быть удален: тогда категория берется из уже посчитанных строк,
+# как ее оставило бы и инкрементальное обновление. Если строк еще не было,
+# категория неизвестна, и такие продажи не попадают в таблицу.
+SALES_DAILY_REBUILD = [
+    "UPDATE sales_daily SET units = 0, revenue = 0, item_count = 0",
+    "INSERT INTO sales_daily (day, product_id, category_id, units, revenue, item_count) "
+    "SELECT * FROM ("
+    "SELECT date(o.created_at) AS day, i.product_id, "
+    "coalesce(p.category_id, (SELECT s.category_id FROM sales_daily s WHERE s.product_id = i.product_id LIMIT 1)) "
+    "AS category_id, sum(i.quantity), sum(i.quantity * i.price_at_purchase), count(*) "
+    "FROM order_items i JOIN orders o ON o.id = i.order_id LEFT JOIN products p ON p.id = i.product_id "
+    "GROUP BY date(o.created_at), i.product_id"
+    ") WHERE category_id IS NOT NULL "
+    "ON CONFLICT (day, product_id) DO UPDATE SET category_id = excluded.category_id, "
+    "units = excluded.units, revenue = excluded.revenue, item_count = excluded.item_count",
+    "DELETE FROM sales_daily WHERE item_count = 0",
+]
+
+for statement in SALES_DAILY_DDL:
+    event.listen(Product.__table__, "after_create", DDL(statement))
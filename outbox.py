@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta, UTC
+from typing import List, Optional, Protocol
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import models as m
+from config import settings
+from database import open_read_session, open_write_session
+from serializers import dumps
+
+logger = logging.getLogger(__name__)
+
+events = m.OutboxEvent.__table__
+
+ORDER_CREATED = "order.created"
+ORDER_ITEMS_UPDATED = "order.items_updated"
+ORDER_STATUS_CHANGED = "order.status_changed"
+ORDER_DELETED = "order.deleted"
+
+# События запущенных обработчиков. asyncio.Event привязывается к циклу
+# событий, поэтому каждый обработчик создает свое в start(): при повторном
+# запуске приложения в том же процессе цикл будет уже другим.
+_wakeups = set()
+
+async def add_event(db: AsyncSession, event_type: str, order_id: int, payload: bytes):
+    """Добавляет событие в текущую транзакцию: оно появится только вместе с изменением заказа."""
+    await db.execute(insert(events).values(
+        event_type=event_type,
+        order_id=order_id,
+        payload=payload.decode("utf-8"),
+        created_at=datetime.now(UTC),
+    ))
+
+def notify():
+    """Будит обработчики после коммита с новыми событиями, чтобы не ждать опроса."""
+    for wakeup in _wakeups:
+        wakeup.set()
+
+class Sink(Protocol):
+    async def publish(self, batch: List[dict]) -> None: ...
+
+class MemorySink:
+    """Хранит последние события в памяти процесса (для проверок)."""
+
+    def __init__(self, maxlen: int = 10000):
+        self.events = deque(maxlen=maxlen)
+
+    async def publish(self, batch: List[dict]):
+        self.events.extend(batch)
+
+class FileSink:
+    """Дописывает события в файл NDJSON, по строке на событие."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _append(self, data: bytes):
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+    async def publish(self, batch: List[dict]):
+        await run_in_threadpool(self._append, b"".join(dumps(event) + b"\n" for event in batch))
+
+def make_sink(name: str) -> Sink:
+    if name == "memory":
+        return MemorySink()
+    return FileSink(settings.OUTBOX_FILE)
+
+class OutboxWorker:
+    """Фоновая задача, которая передает события из outbox_events в приемник.
+
+    События забираются пачками: UPDATE ... RETURNING ставит им срок аренды
+    locked_until, после успешной отправки они удаляются. Если приемник
+    упал, события вернутся в очередь, когда истечет аренда, поэтому
+    доставка — «хотя бы один раз», в порядке id внутри пачки. Несколько
+    процессов не возьмут одно событие одновременно.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        lease: Optional[int] = None,
+    ):
+        self.sink = sink
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval or settings.OUTBOX_POLL_INTERVAL
+        self.lease = lease or settings.OUTBOX_LEASE
+        self.delivered = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def _claim(self) -> List[dict]:
+        now = datetime.now(UTC)
+        pending = (
+            select(events.c.id)
+            .where(or_(events.c.locked_until.is_(None), events.c.locked_until < now))
+            .order_by(events.c.id)
+        )
+        # Пустой опрос не должен занимать писателя: сначала через пул чтения
+        # проверяется, есть ли что забирать (первая строка по первичному ключу).
+        async with open_read_session() as db:
+            if await db.scalar(pending.limit(1)) is None:
+                return []
+        async with open_write_session() as db:
+            rows = (await db.execute(
+                update(events)
+                .where(events.c.id.in_(pending.limit(self.batch_size).scalar_subquery()))
+                .values(locked_until=now + timedelta(seconds=self.lease))
+                .returning(events.c.id, events.c.event_type, events.c.order_id, events.c.payload, events.c.created_at)
+            )).all()
+            await db.commit()
+        return [
+            {
+                "id": row.id,
+                "type": row.event_type,
+                "order_id": row.order_id,
+                "created_at": row.created_at,
+                "payload": orjson.loads(row.payload),
+            }
+            for row in sorted(rows, key=lambda row: row.id)
+        ]
+
+    async def drain_once(self) -> int:
+        batch = await self._claim()
+        if not batch:
+            return 0
+        await self.sink.publish(batch)
+        async with open_write_session() as db:
+            await db.execute(delete(events).where(events.c.id.in_([event["id"] for event in batch])))
+            await db.commit()
+        self.delivered += len(batch)
+        return len(batch)
+
+    async def run(self):
+        while True:
+            try:
+                count = await self.drain_once()
+                if count < self.batch_size:
+                    await self._wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Не удалось передать события outbox")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _wait(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        _wakeups.add(self._wakeup)
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        _wakeups.discard(self._wakeup)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wakeup = None
@@ -0,0 +1,79 @@
+import base64
+import binascii
+import json
+from typing import Optional, Sequence
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import tuple_
+
+def encode_cursor(key: str, values: Sequence) -> str:
+    raw = json.dumps({"k": key, "v": list(values)}, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, key: str, size: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    if not isinstance(data, dict) or data.get("k") != key:
+        raise HTTPException(status_code=400, detail="Курсор не соответствует сортировке")
+    values = data.get("v")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return values
+
+def order_by_key(
+    query,
+    columns: Sequence,
+    *,
+    key: str,
+    cursor: Optional[str],
+    descending: bool = False,
+    cast=None,
+):
+    """Сортирует запрос по ключу и, если передан курсор, продолжает выборку после него."""
+    query = query.order_by(*(c.desc() if descending else c.asc() for c in columns))
+    if cursor:
+        values = decode_cursor(cursor, key, len(columns))
+        if cast:
+            try:
+                values = cast(values)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Некорректный курсор")
+        row_key, bound = tuple_(*columns), tuple_(*values)
+        query = query.where(row_key < bound if descending else row_key > bound)
+    return query
+
+def paginate(
+    query,
+    columns: Sequence,
+    *,
+    key: str,
+    cursor: Optional[str],
+    page: int,
+    limit: int,
+    descending: bool = False,
+    cast=None,
+):
+    """Добавляет к запросу сортировку и постраничную выборку.
+
+    Если передан курсор, страница выбирается по ключу (сортировочные
+    колонки, id) без OFFSET, иначе используется старый режим page/limit.
+    """
+    query = order_by_key(query, columns, key=key, cursor=cursor, descending=descending, cast=cast)
+    if not cursor:
+        query = query.offset((page - 1) * limit)
+    return query.limit(limit)
+
+NEXT_CURSOR_HEADERS = ("X-Next-Cursor", "Link")
+
+def next_cursor_headers(response: Response) -> dict:
+    return {key: response.headers[key] for key in NEXT_CURSOR_HEADERS if key in response.headers}
+
+def set_next_cursor(request: Request, response: Response, key: str, rows: Sequence, limit: int, get_values):
+    if not rows or len(rows) < limit:
+        return
+    cursor = encode_cursor(key, get_values(rows[-1]))
+    url = request.url.remove_query_params("page").include_query_params(cursor=cursor)
+    response.headers["X-Next-Cursor"] = cursor
+    response.headers["Link"] = f'<{url}>; rel="next"'
@@ -0,0 +1,20 @@
+from functools import lru_cache
+from passlib.context import CryptContext
+
+# Модуль не импортирует настройки и базу: его функции выполняются
+# в процессах пула хеширования и должны загружаться быстро.
+
+@lru_cache
+def get_context(rounds: int) -> CryptContext:
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+def hash_password(password: str, rounds: int) -> str:
+    return get_context(rounds).hash(password)
+
+def verify_and_update(plain: str, hashed: str, rounds: int):
+    return get_context(rounds).verify_and_update(plain, hashed)
@@ -0,0 +1,200 @@
+import codecs
+import csv
+import json
+import time
+from datetime import datetime, UTC
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+import models as m
+import pyd
+from catalog_cache import catalog_cache
+from config import settings
+from database import open_read_session, open_write_session
+
+products = m.Product.__table__
+
+PRODUCT_CREATE_LIST = TypeAdapter(List[pyd.ProductCreate])
+
+MAX_REPORTED_ERRORS = 100
+
+_upsert_stmt = insert(products)
+_upsert_stmt = _upsert_stmt.on_conflict_do_update(
+    index_elements=[products.c.name],
+    set_={
+        "price": _upsert_stmt.excluded.price,
+        "description": _upsert_stmt.excluded.description,
+        "remaining_stock": _upsert_stmt.excluded.remaining_stock,
+        "category_id": _upsert_stmt.excluded.category_id,
+        "version": products.c.version + 1,
+    },
+)
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+async def _csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    # Поле в кавычках может содержать перевод строки: запись закончена,
+    # когда число кавычек в ней четное.
+    header = None
+    record, number = "", 0
+    async for line in _lines(chunks):
+        record = record + "\n" + line if record else line
+        if record.count('"') % 2:
+            continue
+        raw, record = record, ""
+        if not raw.strip():
+            continue
+        values = next(csv.reader([raw]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        number += 1
+        row = {key: (value if value != "" else None) for key, value in zip(header, values)}
+        yield number, row
+    if record.strip():
+        number += 1
+        yield number, ValueError("Незакрытые кавычки в строке CSV")
+
+async def _ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    number = 0
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, ValueError("Некорректный JSON")
+            continue
+        if not isinstance(row, dict):
+            yield number, ValueError("Строка должна быть JSON-объектом")
+            continue
+        yield number, row
+
+def _format_errors(errors: list) -> List[str]:
+    return [
+        ".".join(str(part) for part in error["loc"]) + ": " + error["msg"] if error["loc"] else error["msg"]
+        for error in errors
+    ]
+
+class ProductImport:
+    """Загрузка товаров из CSV или NDJSON с upsert по названию.
+
+    Строки проверяются через pyd.ProductCreate пачками, категории берутся из
+    заранее загруженного справочника (по category_id или по названию в поле
+    category). Каждая пачка записывается executemany в отдельной транзакции.
+    """
+
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.category_ids: set = set()
+        self.category_names: Dict[str, int] = {}
+        self.total = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def _fail(self, number: int, messages: List[str]):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": number, "errors": messages})
+
+    def _resolve_category(self, row: dict) -> Optional[str]:
+        name = row.pop("category", None)
+        if row.get("category_id") is None and name is not None:
+            row["category_id"] = self.category_names.get(name.strip())
+            if row["category_id"] is None:
+                return f"category: категория '{name}' не найдена"
+        return None
+
+    def _validate(self, batch: List[Tuple[int, dict]]) -> List[Tuple[int, pyd.ProductCreate]]:
+        try:
+            items = PRODUCT_CREATE_LIST.validate_python([row for _, row in batch])
+            return [(number, item) for (number, _), item in zip(batch, items)]
+        except ValidationError as error:
+            failed: Dict[int, list] = {}
+            for item in error.errors():
+                failed.setdefault(item["loc"][0], []).append({**item, "loc": item["loc"][1:]})
+
+        valid = []
+        for index, (number, row) in enumerate(batch):
+            if index in failed:
+                self._fail(number, _format_errors(failed[index]))
+            else:
+                valid.append((number, pyd.ProductCreate.model_validate(row)))
+        return valid
+
+    async def _write(self, batch: List[Tuple[int, dict]]):
+        valid = []
+        for number, item in self._validate(batch):
+            if item.category_id not in self.category_ids:
+                self._fail(number, [f"category_id: категория с ID {item.category_id} не найдена"])
+            else:
+                valid.append(item)
+        if not valid:
+            return
+
+        # Повтор названия внутри пачки обновляет уже вставленную строку.
+        params = {item.name: item.model_dump() for item in valid}
+        now = datetime.now(UTC)
+        async with open_write_session() as db:
+            existing = set((await db.scalars(
+                select(products.c.name).where(products.c.name.in_(list(params)))
+            )).all())
+            await db.execute(_upsert_stmt, [{**values, "created_at": now} for values in params.values()])
+            await db.commit()
+        catalog_cache.invalidate_all()
+        self.created += len(params) - len(existing)
+        self.updated += len(valid) - (len(params) - len(existing))
+
+    async def run(self, records: AsyncIterator[Tuple[int, object]]) -> dict:
+        started = time.perf_counter()
+        async with open_read_session() as db:
+            for category_id, name in await db.execute(select(m.Category.id, m.Category.name)):
+                self.category_ids.add(category_id)
+                self.category_names[name] = category_id
+
+        batch = []
+        async for number, row in records:
+            self.total += 1
+            if isinstance(row, Exception):
+                self._fail(number, [str(row)])
+                continue
+            error = self._resolve_category(row)
+            if error:
+                self._fail(number, [error])
+                continue
+            batch.append((number, row))
+            if len(batch) >= self.chunk_size:
+                await self._write(batch)
+                batch = []
+        if batch:
+            await self._write(batch)
+
+        seconds = time.perf_counter() - started
+        return {
+            "total": self.total,
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.total / seconds, 1) if seconds else 0.0,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+        }
+
+async def import_products(chunks: AsyncIterator[bytes], format: str) -> dict:
+    records = _ndjson_records(chunks) if format == "ndjson" else _csv_records(chunks)
+    return await ProductImport(settings.IMPORT_CHUNK_SIZE).run(records)
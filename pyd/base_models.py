@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, conint, confloat
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime
 
 class RoleBase(BaseModel):
     name: str
@@ -38,6 +38,18 @@ class CategoryRead(CategoryBase):
     class Config:
         from_attributes = True
 
+class ProductRatingRead(BaseModel):
+    rating_count: int = 0
+    rating_avg: float = 0
+    stars_1: int = 0
+    stars_2: int = 0
+    stars_3: int = 0
+    stars_4: int = 0
+    stars_5: int = 0
+
+    class Config:
+        from_attributes = True
+
 class ProductBase(BaseModel):
     id: int
     name: str
@@ -45,6 +57,26 @@ class ProductBase(BaseModel):
     description: Optional[str] = None
     remaining_stock: Optional[float] = None
     category_id: int = Field(..., gt=0)
+    version: int
+    rating: Optional[ProductRatingRead] = None
+
+class ProductBatchRead(BaseModel):
+    # В порядке запрошенных id, null на месте ненайденных.
+    products: List[Optional[ProductBase]]
+    missing: List[int]
+
+class ProductImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ProductImportResult(BaseModel):
+    total: int
+    created: int
+    updated: int
+    failed: int
+    seconds: float
+    rows_per_second: float
+    errors: List[ProductImportError]
 
 class ProductRead(ProductBase):
     id: int
@@ -77,6 +109,7 @@ class OrderBase(BaseModel):
     total_amount: float
     created_at: datetime
     updated_at: datetime
+    version: int
     items: List[OrderItemBase]
     
     class Config:
@@ -107,3 +140,11 @@ class ReviewRead(ReviewBase):
 class ReviewUpdate(BaseModel):
     rating: int = Field(..., ge=1, le=5)
     text: Optional[str] = None
+
+class SalesRead(BaseModel):
+    day: Optional[date] = None
+    category_id: Optional[int] = None
+    product_id: Optional[int] = None
+    units: int
+    revenue: float
+    item_count: int
@@ -41,6 +41,10 @@ class ProductCreate(BaseModel):
             raise ValueError("Price must be greater than 0")
         return v
 
+class ProductUpdate(ProductCreate):
+    # Версия товара, которую видел клиент; при несовпадении вернется 409.
+    version: Optional[int] = None
+
 class OrderStatusCreate(BaseModel):
     name: str
 
@@ -85,4 +89,5 @@ class OrderItemInput(BaseModel):
     quantity: int
 
 class OrderItemsUpdate(BaseModel):
-    items: List[OrderItemInput]
\ No newline at end of file
+    items: List[OrderItemInput]
+    version: Optional[int] = None
\ No newline at end of file
@@ -0,0 +1,58 @@
+from typing import Optional
+from sqlalchemy import case
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+import models as m
+
+stats = m.ProductRatingStats.__table__
+
+def _delta(old_rating: Optional[int], new_rating: Optional[int]) -> dict:
+    delta = {"rating_count": 0, "rating_sum": 0, **{f"stars_{star}": 0 for star in range(1, 6)}}
+    if old_rating is not None:
+        delta["rating_count"] -= 1
+        delta["rating_sum"] -= old_rating
+        delta[f"stars_{old_rating}"] -= 1
+    if new_rating is not None:
+        delta["rating_count"] += 1
+        delta["rating_sum"] += new_rating
+        delta[f"stars_{new_rating}"] += 1
+    return delta
+
+async def apply_rating_change(
+    db: AsyncSession,
+    product_id: int,
+    old_rating: Optional[int],
+    new_rating: Optional[int],
+):
+    """Обновляет агрегаты рейтинга товара в текущей транзакции.
+
+    old_rating — оценка до изменения (None для нового отзыва),
+    new_rating — после (None для удаленного).
+    """
+    delta = _delta(old_rating, new_rating)
+    if not any(delta.values()):
+        return
+
+    statement = insert(stats).values(
+        product_id=product_id,
+        rating_avg=delta["rating_sum"] / delta["rating_count"] if delta["rating_count"] > 0 else 0,
+        **delta,
+    )
+    # rating_avg нельзя взять из уже обновленных столбцов: в SET они еще
+    # старые. Поэтому новые count и sum повторяются здесь как выражения.
+    count = stats.c.rating_count + delta["rating_count"]
+    total = stats.c.rating_sum + delta["rating_sum"]
+    statement = statement.on_conflict_do_update(
+        index_elements=[stats.c.product_id],
+        set_={
+            **{column: stats.c[column] + value for column, value in delta.items()},
+            "rating_avg": case((count > 0, total * 1.0 / count), else_=0),
+        },
+    )
+    await db.execute(statement)
+
+def rebuild_rating_stats(connection: Connection):
+    """Пересчитывает агрегаты рейтинга всех товаров по таблице отзывов."""
+    for statement in m.PRODUCT_RATING_STATS_REBUILD:
+        connection.exec_driver_sql(statement)
@@ -0,0 +1,12 @@
+"""Пересчет агрегатов рейтинга товаров по таблице отзывов.
+
+    python rebuild_ratings.py
+"""
+from database import engine
+from ratings import rebuild_rating_stats
+
+if __name__ == "__main__":
+    with engine.begin() as connection:
+        rebuild_rating_stats(connection)
+        count = connection.exec_driver_sql("SELECT count(*) FROM product_rating_stats").scalar()
+    print(f"Пересчитан рейтинг товаров: {count}")
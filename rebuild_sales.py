@@ -0,0 +1,12 @@
+"""Пересчет дневных продаж по таблице заказов.
+
+    python rebuild_sales.py
+"""
+from database import engine
+from sales import rebuild_sales_daily
+
+if __name__ == "__main__":
+    with engine.begin() as connection:
+        rebuild_sales_daily(connection)
+        count = connection.exec_driver_sql("SELECT count(*) FROM sales_daily").scalar()
+    print(f"Пересчитаны продажи: {count} строк (день, товар)")
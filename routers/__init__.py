@@ -3,4 +3,6 @@ from .product_router import router as product_router
 from .auth_router import router as auth_router
 from .orders_router import router as orders_router
 from .review_router import router as review_router
-from .category_router import router as category_router
\ No newline at end of file
+from .category_router import router as category_router
+from .metrics_router import router as metrics_router
+from .analytics_router import router as analytics_router
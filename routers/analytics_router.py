@@ -0,0 +1,75 @@
+from datetime import date
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth import Principal, get_current_user
+from database import get_async_db
+import models as m
+import pyd
+from serializers import json_response, money
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+sales = m.SalesDaily.__table__
+
+SALES_GROUPS = {
+    "day": sales.c.day,
+    "category": sales.c.category_id,
+    "product": sales.c.product_id,
+}
+
+@router.get("/sales", response_model=List[pyd.SalesRead])
+async def get_sales(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None, description="Включительно"),
+    group_by: List[Literal["day", "category", "product"]] = Query(["day"]),
+    category_id: Optional[int] = Query(None),
+    product_id: Optional[int] = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """Выручка, проданные единицы и число позиций заказов за период.
+
+    Отвечает по таблице sales_daily, которую заказы обновляют при каждом
+    изменении, а не по самим заказам.
+    """
+    if current_user.role_id not in (2, 3):
+        raise HTTPException(status_code=403, detail="Недостаточно прав для просмотра продаж")
+
+    groups = list(dict.fromkeys(group_by))
+    columns = [SALES_GROUPS[group] for group in groups]
+    revenue = func.sum(sales.c.revenue)
+    query = select(
+        *columns,
+        func.sum(sales.c.units).label("units"),
+        revenue.label("revenue"),
+        func.sum(sales.c.item_count).label("item_count"),
+    ).group_by(*columns)
+    if date_from is not None:
+        query = query.where(sales.c.day >= date_from)
+    if date_to is not None:
+        query = query.where(sales.c.day <= date_to)
+    if category_id is not None:
+        query = query.where(sales.c.category_id == category_id)
+    if product_id is not None:
+        query = query.where(sales.c.product_id == product_id)
+    # По дням — в хронологическом порядке, иначе сначала самые доходные.
+    if "day" in groups:
+        query = query.order_by(sales.c.day, revenue.desc())
+    else:
+        query = query.order_by(revenue.desc())
+
+    rows = await db.execute(query.limit(limit))
+    return json_response([
+        {
+            "day": row._mapping.get(sales.c.day),
+            "category_id": row._mapping.get(sales.c.category_id),
+            "product_id": row._mapping.get(sales.c.product_id),
+            "units": row.units,
+            "revenue": money(row.revenue),
+            "item_count": row.item_count,
+        }
+        for row in rows
+    ])
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
-from database import get_db
-from sqlalchemy.orm import Session
+from database import get_read_db
+from sqlalchemy.ext.asyncio import AsyncSession
 import pyd
 from auth import authenticate_user, create_access_token
 from fastapi.security import OAuth2PasswordRequestForm
@@ -8,8 +8,8 @@ from fastapi.security import OAuth2PasswordRequestForm
 router = APIRouter()
 
 @router.post("/login", response_model=pyd.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_read_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Неверные учетные данные")
     token = create_access_token(data={"sub": str(user.id), "role": str(user.role_id)})
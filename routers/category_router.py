@@ -1,71 +1,88 @@
-from fastapi import APIRouter, HTTPException, Depends
-from database import get_db
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Request
+from database import get_async_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter
 import models as m
 import pyd
 from typing import List
-from auth import get_current_user
+from auth import Principal, get_current_user
+from catalog_cache import cached_response, catalog_cache
 
 router = APIRouter(
     prefix="/category",
     tags=["category"],
 )
 
+CATEGORY_LIST_ADAPTER = TypeAdapter(List[pyd.CategoryRead])
+
 @router.get("/", response_model=List[pyd.CategoryRead])
-def get_all_categories(db: Session = Depends(get_db)):
-    return db.query(m.Category).all()
+async def get_all_categories(request: Request, db: AsyncSession = Depends(get_async_db)):
+    generation = catalog_cache.generation
+    cache_key = catalog_cache.list_key("categories")
+    entry = catalog_cache.get(cache_key)
+    if entry is not None:
+        return cached_response(request, entry)
+
+    categories = (await db.scalars(select(m.Category))).all()
+    body = CATEGORY_LIST_ADAPTER.dump_json(CATEGORY_LIST_ADAPTER.validate_python(categories, from_attributes=True))
+    entry = catalog_cache.store(cache_key, body, generation)
+    return cached_response(request, entry)
 
 @router.post("/", response_model=pyd.CategoryRead)
-def create_category(
+async def create_category(
     data: pyd.CategoryCreate,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role_id != 3:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
 
-    existing = db.query(m.Category).filter_by(name=data.name).first()
+    existing = await db.scalar(select(m.Category).filter_by(name=data.name))
     if existing:
         raise HTTPException(status_code=400, detail="Такая категория уже существует")
 
     category = m.Category(**data.dict())
     db.add(category)
-    db.commit()
-    db.refresh(category)
+    await db.commit()
+    catalog_cache.invalidate_lists()
+    await db.refresh(category)
     return category
 
 @router.put("/{category_id}", response_model=pyd.CategoryRead)
-def update_category(
+async def update_category(
     category_id: int,
     data: pyd.CategoryCreate,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role_id != 3: 
         raise HTTPException(status_code=403, detail="Только администратор может редактировать категории")
 
-    category = db.query(m.Category).get(category_id)
+    category = await db.get(m.Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Категория не найдена")
 
     category.name = data.name
-    db.commit()
-    db.refresh(category)
+    await db.commit()
+    catalog_cache.invalidate_lists()
+    await db.refresh(category)
     return category
 
 @router.delete("/{category_id}")
-def delete_category(
+async def delete_category(
     category_id: int,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role_id != 3:
         raise HTTPException(status_code=403, detail="Только администратор может удалить категорию")
 
-    category = db.query(m.Category).get(category_id)
+    category = await db.get(m.Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Категория не найдена")
 
-    db.delete(category)
-    db.commit()
+    await db.delete(category)
+    await db.commit()
+    catalog_cache.invalidate_all()
     return {"detail": "Категория успешно удалена"}
\ No newline at end of file
@@ -0,0 +1,8 @@
+from fastapi import APIRouter, Response
+from metrics import metrics
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
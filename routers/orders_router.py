@@ -1,52 +1,275 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, status
-from database import get_db
-from sqlalchemy.orm import Session
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from database import get_async_db, open_read_session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 import models as m
 import pyd
-from typing import List
-from auth import get_current_user
+from typing import AsyncIterator, List, Literal, Optional, Tuple
+from auth import Principal, get_current_user
+from pagination import next_cursor_headers, paginate, set_next_cursor
+from inventory import find_products, merge_quantities, release_stock, reserve_stock
+from catalog_cache import catalog_cache
+from streaming import csv_lines, ndjson_line, stream_partitions
+from serializers import json_response, money
+from versioning import compare_and_swap
+from idempotency import IdempotentRequest
+from fieldsets import FieldSet, strip_fields
+from sales import apply_sales_change
+import outbox
 
 router = APIRouter(
     prefix="/orders",
     tags=["orders"],
 )
 
+ORDER_CONFLICT = "Заказ был изменен другим пользователем, загрузите его заново и повторите запрос"
+
+def _order_rows_query(page_query):
+    page = page_query.subquery()
+    return (
+        select(
+            page,
+            m.OrderItem.product_id,
+            m.OrderItem.quantity,
+            m.OrderItem.price_at_purchase,
+        )
+        .outerjoin(m.OrderItem, m.OrderItem.order_id == page.c.id)
+        .order_by(page.c.id)
+    )
+
+def _item_price(value):
+    # pyd.OrderItemBase объявляет цену целым числом.
+    value = money(value)
+    return int(value) if value.is_integer() else value
+
+ORDER_FIELDS = FieldSet({
+    "id": ((m.Order.id,), None),
+    "user_id": ((m.Order.user_id,), None),
+    "status_id": ((m.Order.status_id,), None),
+    "total_amount": ((m.Order.total_amount,), money),
+    "created_at": ((m.Order.created_at,), None),
+    "updated_at": ((m.Order.updated_at,), None),
+    "version": ((m.Order.version,), None),
+    # Позиции загружаются отдельным соединением, только если их запросили.
+    "items": ((), None),
+})
+
+def _build_orders(rows, names) -> List[dict]:
+    """Собирает заказы из строк ORDER_FIELDS.columns(names) + позиция."""
+    build = ORDER_FIELDS.builder(names)
+    width = len(ORDER_FIELDS.columns(names))
+    orders = {}
+    for row in rows:
+        order_id = row[0]
+        order = orders.get(order_id)
+        if order is None:
+            order = orders[order_id] = {**build(row), "items": []}
+        product_id, quantity, price = row[width:]
+        if product_id is not None:
+            order["items"].append({
+                "product_id": product_id,
+                "quantity": quantity,
+                "price_at_purchase": _item_price(price),
+            })
+    return list(orders.values())
+
+def _paginate_orders(query, cursor: Optional[str], page: int, limit: int):
+    return paginate(
+        query, (m.Order.id,),
+        key="id", cursor=cursor, page=page, limit=limit,
+        cast=lambda values: [int(values[0])],
+    )
+
+async def _list_orders(
+    request: Request,
+    response: Response,
+    db: AsyncSession,
+    where: tuple,
+    fields: Optional[str],
+    cursor: Optional[str],
+    page: int,
+    limit: int,
+) -> Response:
+    selected = ORDER_FIELDS.parse(fields)
+    # id нужен для курсора и для группировки позиций по заказам.
+    loaded = ORDER_FIELDS.names if selected is None else ORDER_FIELDS.ordered({*selected, "id"})
+    page_query = _paginate_orders(select(*ORDER_FIELDS.columns(loaded)).where(*where), cursor, page, limit)
+    if "items" in loaded:
+        orders = _build_orders(await db.execute(_order_rows_query(page_query)), loaded)
+    else:
+        build = ORDER_FIELDS.builder(loaded)
+        orders = [build(row) for row in await db.execute(page_query)]
+
+    set_next_cursor(request, response, "id", orders, limit, lambda o: [o["id"]])
+    if selected is not None and "id" not in selected:
+        orders = strip_fields(orders, selected)
+    return json_response(orders, next_cursor_headers(response))
+
+async def _get_order(db: AsyncSession, order_id: int, *options):
+    return await db.scalar(
+        select(m.Order)
+        .where(m.Order.id == order_id)
+        .options(selectinload(m.Order.items), *options)
+        .execution_options(populate_existing=True)
+    )
+
+async def _idempotent_request(
+    db: AsyncSession, user_id: int, key: Optional[str], scope: str, payload
+) -> Tuple[Optional[IdempotentRequest], Optional[Response]]:
+    if key is None:
+        return None, None
+    request = IdempotentRequest(user_id, key, scope, payload)
+    return request, await request.replay(db)
+
+def _order_body(order: m.Order) -> bytes:
+    return pyd.OrderBase.model_validate(order).model_dump_json().encode("utf-8")
+
+async def _commit_order(
+    db: AsyncSession,
+    order_id: int,
+    event_type: str,
+    product_ids=(),
+    idempotent: Optional[IdempotentRequest] = None,
+) -> Response:
+    """Фиксирует изменение заказа вместе с событием outbox и ответом для Idempotency-Key."""
+    await db.flush()
+    body = _order_body(await _get_order(db, order_id))
+    await outbox.add_event(db, event_type, order_id, body)
+    if idempotent is not None and not await idempotent.remember(db, body):
+        # Параллельный запрос с тем же ключом успел раньше: его заказ
+        # остается, этот откатывается.
+        await db.rollback()
+        return await idempotent.replay(db)
+    await db.commit()
+    catalog_cache.invalidate_products(product_ids)
+    outbox.notify()
+    if idempotent is not None:
+        return idempotent.response(body)
+    return Response(content=body, media_type="application/json")
+
 @router.get("/", response_model=List[pyd.OrderBase])
-def get_all_orders(
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user),
+async def get_all_orders(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
     page: int = Query(1, ge=1),
     limit: int = Query(10, le=100),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например id,status_id,total_amount"),
 ):
     if current_user.role_id not in (2, 3):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Недостаточно прав для создания продукта"
         )
-    query = db.query(m.Order)
-
-    offset = (page - 1) * limit
-    return query.offset(offset).limit(limit).all()
+    return await _list_orders(request, response, db, (), fields, cursor, page, limit)
 
 @router.get("/user_orders", response_model=List[pyd.OrderBase])
-def get_all_orders_user(
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user),
+async def get_all_orders_user(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
     page: int = Query(1, ge=1),
     limit: int = Query(10, le=100),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например id,status_id,total_amount"),
+):
+    where = (m.Order.user_id == current_user.id,)
+    return await _list_orders(request, response, db, where, fields, cursor, page, limit)
+
+EXPORT_ORDER_COLUMNS = (
+    m.Order.id,
+    m.Order.user_id,
+    m.Order.status_id,
+    m.Order.total_amount,
+    m.Order.created_at,
+    m.Order.updated_at,
+)
+
+EXPORT_CSV_HEADER = (
+    "order_id", "user_id", "status_id", "total_amount", "created_at", "updated_at",
+    "product_id", "quantity", "price_at_purchase",
+)
+
+def _export_query(date_from: Optional[datetime], date_to: Optional[datetime], status_id: Optional[int]):
+    query = (
+        select(*EXPORT_ORDER_COLUMNS, m.OrderItem.product_id, m.OrderItem.quantity, m.OrderItem.price_at_purchase)
+        .outerjoin(m.OrderItem, m.OrderItem.order_id == m.Order.id)
+        .order_by(m.Order.created_at, m.Order.id)
+    )
+    if date_from is not None:
+        query = query.where(m.Order.created_at >= date_from)
+    if date_to is not None:
+        query = query.where(m.Order.created_at < date_to)
+    if status_id is not None:
+        query = query.where(m.Order.status_id == status_id)
+    return query
+
+async def _export_ndjson(query) -> AsyncIterator[bytes]:
+    # Строки одного заказа идут подряд, но могут оказаться в разных порциях,
+    # поэтому незаконченный заказ переносится в следующую.
+    order = None
+    async for rows in stream_partitions(query):
+        lines = []
+        for row in rows:
+            if order is None or order["id"] != row.id:
+                if order is not None:
+                    lines.append(ndjson_line(order))
+                order = {
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "status_id": row.status_id,
+                    "total_amount": row.total_amount,
+                    "created_at": row.created_at,
+                    "updated_at": row.updated_at,
+                    "items": [],
+                }
+            if row.product_id is not None:
+                order["items"].append({
+                    "product_id": row.product_id,
+                    "quantity": row.quantity,
+                    "price_at_purchase": row.price_at_purchase,
+                })
+        if lines:
+            yield b"".join(lines)
+    if order is not None:
+        yield ndjson_line(order)
+
+async def _export_csv(query) -> AsyncIterator[bytes]:
+    yield csv_lines([EXPORT_CSV_HEADER])
+    async for rows in stream_partitions(query):
+        yield csv_lines(rows)
+
+@router.get("/export")
+async def export_orders(
+    current_user: Principal = Depends(get_current_user),
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    status_id: Optional[int] = Query(None),
 ):
-    query = db.query(m.Order).filter(m.Order.user_id == current_user.id)
+    if current_user.role_id not in (2, 3):
+        raise HTTPException(status_code=403, detail="Недостаточно прав для выгрузки заказов")
 
-    offset = (page - 1) * limit
-    return query.offset(offset).limit(limit).all()
+    query = _export_query(date_from, date_to, status_id)
+    filename = f"orders.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == "csv":
+        return StreamingResponse(_export_csv(query), media_type="text/csv; charset=utf-8", headers=headers)
+    return StreamingResponse(_export_ndjson(query), media_type="application/x-ndjson", headers=headers)
 
 @router.get("/{order_id}", response_model=pyd.OrderBase)
-def get_order(
+async def get_order(
     order_id: int, 
-    db: Session = Depends(get_db), 
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: Principal = Depends(get_current_user)
 ):
-    order = db.query(m.Order).get(order_id)
+    order = await _get_order(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
 
@@ -56,36 +279,37 @@ def get_order(
     return order
 
 @router.post("/create", response_model=pyd.OrderBase)
-def create_order(
+async def create_order(
     order_data: pyd.OrderCreate,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
 ):
     if not order_data.items:
         raise HTTPException(status_code=400, detail="Нельзя создать заказ без товаров")
 
+    # Соединение писателя одно на процесс, поэтому все чтения и проверки
+    # идут через пул чтения, а писатель занимается только изменениями.
+    async with open_read_session() as read_db:
+        idempotent, replayed = await _idempotent_request(
+            read_db, current_user.id, idempotency_key, "create_order", order_data
+        )
+        if replayed is not None:
+            return replayed
+        quantities = merge_quantities(order_data.items)
+        products = await find_products(read_db, quantities)
+
     total = 0
     order_items = []
 
-    for item in order_data.items:
-        product = db.query(m.Product).filter(m.Product.id == item.product_id).with_for_update().first()
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Товар ID {item.product_id} не найден")
-
-        if item.quantity > product.remaining_stock:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Недостаточно товара '{product.name}' на складе. Осталось: {product.remaining_stock}"
-            )
-
-        product.remaining_stock -= item.quantity
-        
-        total += item.quantity * float(product.price)
+    for product_id, quantity in quantities.items():
+        price = products[product_id].price
+        total += quantity * float(price)
         order_items.append(
             m.OrderItem(
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price_at_purchase=product.price
+                product_id=product_id,
+                quantity=quantity,
+                price_at_purchase=price
             )
         )
 
@@ -96,90 +320,103 @@ def create_order(
         items=order_items
     )
 
+    await reserve_stock(db, quantities)
     db.add(order)
-    db.commit()
-    db.refresh(order)
-    return order
+    await db.flush()
+    await apply_sales_change(db, order.created_at, added=order_items)
+    return await _commit_order(db, order.id, outbox.ORDER_CREATED, quantities, idempotent)
 
 @router.put("/update-status/{order_id}", response_model=pyd.OrderBase)
-def update_order_status(
+async def update_order_status(
     order_id: int,
     status_id: int,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    version: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role_id not in (2, 3):
         raise HTTPException(status_code=403, detail="Недостаточно прав для изменения статуса")
 
-    order = db.query(m.Order).get(order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Заказ не найден")
-
-    status = db.query(m.OrderStatus).get(status_id)
+    async with open_read_session() as read_db:
+        status = await read_db.get(m.OrderStatus, status_id)
     if not status:
         raise HTTPException(status_code=400, detail="Статус не существует")
 
-    order.status_id = status_id
-    db.commit()
-    db.refresh(order)
-    return order
+    await compare_and_swap(
+        db, m.Order, order_id, version,
+        not_found="Заказ не найден", conflict=ORDER_CONFLICT,
+        status_id=status_id,
+    )
+    return await _commit_order(db, order_id, outbox.ORDER_STATUS_CHANGED)
 
 @router.put("/update-items/{order_id}", response_model=pyd.OrderBase)
-def update_order_items(
+async def update_order_items(
     order_id: int,
     items_data: pyd.OrderItemsUpdate,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
 ):
     if current_user.role_id not in (2, 3):
         raise HTTPException(status_code=403, detail="Недостаточно прав для изменения состава заказа")
 
-    order = db.query(m.Order).get(order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Заказ не найден")
+    async with open_read_session() as read_db:
+        idempotent, replayed = await _idempotent_request(
+            read_db, current_user.id, idempotency_key, f"update_order_items:{order_id}", items_data
+        )
+        if replayed is not None:
+            return replayed
 
-    for item in order.items:
-        product = db.query(m.Product).get(item.product_id)
-        if product:
-            product.remaining_stock += item.quantity
+        order = await _get_order(read_db, order_id)
+        if not order:
+            raise HTTPException(status_code=404, detail="Заказ не найден")
 
-    db.query(m.OrderItem).filter(m.OrderItem.order_id == order.id).delete()
+        quantities = merge_quantities(items_data.items)
+        products = await find_products(read_db, quantities)
 
     new_items = []
     total = 0
-    for item in items_data.items:
-        product = db.query(m.Product).filter(m.Product.id == item.product_id).with_for_update().first()
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Товар ID {item.product_id} не найден")
-        if item.quantity > product.remaining_stock:
-            raise HTTPException(status_code=400, detail=f"Недостаточно товара '{product.name}' на складе")
-
-        product.remaining_stock -= item.quantity
-        total += item.quantity * float(product.price)
+    for product_id, quantity in quantities.items():
+        price = products[product_id].price
+        total += quantity * float(price)
 
         new_items.append(
             m.OrderItem(
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price_at_purchase=product.price,
+                product_id=product_id,
+                quantity=quantity,
+                price_at_purchase=price,
                 order_id=order.id
             )
         )
 
-    order.total_amount = total
-    order.items = new_items
+    # Заказ прочитан через пул чтения, и возврат остатков считается по этому
+    # составу, поэтому первым изменением в транзакции проверяется, что заказ
+    # с тех пор не менялся. Дальше SQLite не пустит других писателей до коммита.
+    expected_version = order.version if items_data.version is None else items_data.version
+    await compare_and_swap(
+        db, m.Order, order.id, expected_version,
+        not_found="Заказ не найден", conflict=ORDER_CONFLICT,
+        total_amount=total,
+    )
+
+    released = merge_quantities(order.items)
+    await release_stock(db, released)
 
-    db.commit()
-    db.refresh(order)
-    return order
+    await db.execute(delete(m.OrderItem).where(m.OrderItem.order_id == order.id))
+    await reserve_stock(db, quantities)
+    db.add_all(new_items)
+
+    await apply_sales_change(db, order.created_at, removed=order.items, added=new_items)
+
+    return await _commit_order(db, order.id, outbox.ORDER_ITEMS_UPDATED, {**released, **quantities}, idempotent)
 
 @router.delete("/delete/{order_id}")
-def delete_order(
+async def delete_order(
     order_id: int,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    order = db.query(m.Order).get(order_id)
+    order = await _get_order(db, order_id, selectinload(m.Order.status))
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
 
@@ -189,12 +426,14 @@ def delete_order(
         if order.status.name.lower() != "новый":
             raise HTTPException(status_code=400, detail="Удалять можно только заказы со статусом 'новый'")
 
-    for item in order.items:
-        product = db.query(m.Product).get(item.product_id)
-        if product:
-            product.remaining_stock += item.quantity
+    released = merge_quantities(order.items)
+    await release_stock(db, released)
+    await apply_sales_change(db, order.created_at, removed=order.items)
 
-    db.delete(order)
-    db.commit()
+    await outbox.add_event(db, outbox.ORDER_DELETED, order.id, _order_body(order))
+    await db.delete(order)
+    await db.commit()
+    catalog_cache.invalidate_products(released)
+    outbox.notify()
 
     return {"detail": "Заказ успешно удалён"}
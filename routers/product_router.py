@@ -1,57 +1,222 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, status
-from database import get_db
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
+from database import get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from pydantic import TypeAdapter
 import models as m
 import pyd
-from typing import List, Optional
-from auth import get_current_user
+import search
+from typing import List, Literal, Optional
+from auth import Principal, get_current_user
+from catalog_cache import cached_response, catalog_cache
+from fieldsets import FieldSet, strip_fields
+from pagination import next_cursor_headers, paginate, set_next_cursor
+from product_import import import_products
+from serializers import dumps, money
+from versioning import compare_and_swap
 
 router = APIRouter(
     prefix="/product",
     tags=["product"],
 )
 
+PRODUCT_ADAPTER = TypeAdapter(pyd.ProductBase)
+
+PRODUCT_BATCH_LIMIT = 300
+
+stats = m.ProductRatingStats
+
+def _rating_dict(rating_count, rating_avg, stars_1, stars_2, stars_3, stars_4, stars_5) -> Optional[dict]:
+    if rating_count is None:
+        return None
+    return {
+        "rating_count": rating_count,
+        "rating_avg": rating_avg,
+        "stars_1": stars_1,
+        "stars_2": stars_2,
+        "stars_3": stars_3,
+        "stars_4": stars_4,
+        "stars_5": stars_5,
+    }
+
+PRODUCT_FIELDS = FieldSet({
+    "id": ((m.Product.id,), None),
+    "name": ((m.Product.name,), None),
+    "price": ((m.Product.price,), float),
+    "description": ((m.Product.description,), None),
+    "remaining_stock": ((m.Product.remaining_stock,), money),
+    "category_id": ((m.Product.category_id,), None),
+    "version": ((m.Product.version,), None),
+    "rating": (
+        (stats.rating_count, stats.rating_avg, stats.stars_1, stats.stars_2, stats.stars_3, stats.stars_4, stats.stars_5),
+        _rating_dict,
+    ),
+})
+
+# Поля, без которых не построить курсор; id нужен всегда.
+PRODUCT_SORT_FIELDS = {
+    "price": ("price",),
+    "-price": ("price",),
+    "rating": ("rating",),
+}
+
+def _product_body(product: m.Product) -> bytes:
+    return PRODUCT_ADAPTER.dump_json(PRODUCT_ADAPTER.validate_python(product, from_attributes=True))
+
+def _normalize(value: Optional[str]) -> Optional[str]:
+    return " ".join(value.lower().split()) if value else None
+
+PRODUCT_SORTS = {
+    "id": ((m.Product.id,), False),
+    "price": ((m.Product.price, m.Product.id), False),
+    "-price": ((m.Product.price, m.Product.id), True),
+    "rating": ((m.ProductRatingStats.rating_avg, m.ProductRatingStats.product_id), True),
+}
+
+def _product_sort_values(sort: str, product: dict) -> list:
+    if sort == "id":
+        return [product["id"]]
+    if sort == "rating":
+        return [product["rating"]["rating_avg"], product["id"]]
+    return [product["price"], product["id"]]
+
+def _cast_product_cursor(sort: str, values: list) -> list:
+    if sort == "id":
+        return [int(values[0])]
+    return [float(values[0]), int(values[1])]
+
 @router.get("/products", response_model=List[pyd.ProductBase])
-def get_all_products(
-    db: Session = Depends(get_db),
+async def get_all_products(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     page: int = Query(1, ge=1),
     limit: int = Query(10, le=100),
+    cursor: Optional[str] = Query(None),
+    sort: Optional[Literal["id", "price", "-price", "rating", "relevance"]] = Query(None),
+    q: Optional[str] = Query(None),
     name: str = Query(None),
     category_id: int = Query(None),
     min_price: Optional[float] = Query(None, ge=0),
-    max_price: Optional[float] = Query(None, ge=0)
+    max_price: Optional[float] = Query(None, ge=0),
+    fields: Optional[str] = Query(None, description="Поля через запятую, например id,name,price"),
 ):
-    query = db.query(m.Product)
+    match = search.match_expression(name, q)
+    if sort is None:
+        sort = "relevance" if match and q else "id"
 
-    if name:
-        search = f"%{name.lower()}%"
-        query = query.filter(func.lower(m.Product.name).like(search))
+    selected = PRODUCT_FIELDS.parse(fields)
+    if selected is None:
+        loaded = PRODUCT_FIELDS.names
+    else:
+        loaded = PRODUCT_FIELDS.ordered({*selected, "id", *PRODUCT_SORT_FIELDS.get(sort, ())})
+    query = select(*PRODUCT_FIELDS.columns(loaded))
+
+    if match:
+        query = search.filter_products(query, match)
 
     if category_id is not None:
-        query = query.filter(m.Product.category_id == category_id)
+        query = query.where(m.Product.category_id == category_id)
 
     if min_price is not None:
-        query = query.filter(m.Product.price >= min_price)
+        query = query.where(m.Product.price >= min_price)
 
     if max_price is not None:
-        query = query.filter(m.Product.price <= max_price)
+        query = query.where(m.Product.price <= max_price)
+
+    # Строка статистики есть у каждого товара; внутреннее соединение нужно
+    # сортировке по рейтингу, чтобы выборка шла по индексу статистики.
+    if sort == "rating":
+        query = query.join(stats, stats.product_id == m.Product.id)
+    elif "rating" in loaded:
+        query = query.outerjoin(stats, stats.product_id == m.Product.id)
+
+    generation = catalog_cache.generation
+    cache_key = catalog_cache.list_key(
+        "products", page, limit, cursor, sort,
+        _normalize(q), _normalize(name), category_id, min_price, max_price, selected,
+    )
+    entry = catalog_cache.get(cache_key)
+    if entry is not None:
+        return cached_response(request, entry)
+
+    build = PRODUCT_FIELDS.builder(loaded)
+    if sort == "relevance":
+        if not match:
+            raise HTTPException(status_code=400, detail="Сортировка по релевантности доступна только при поиске")
+        if cursor:
+            raise HTTPException(status_code=400, detail="Курсор не поддерживается для сортировки по релевантности")
+        offset = (page - 1) * limit
+        query = query.order_by(search.relevance(), m.Product.id).offset(offset).limit(limit)
+        products = [build(row) for row in await db.execute(query)]
+    else:
+        columns, descending = PRODUCT_SORTS[sort]
+        query = paginate(
+            query, columns,
+            key=sort, cursor=cursor, page=page, limit=limit, descending=descending,
+            cast=lambda values: _cast_product_cursor(sort, values),
+        )
+        products = [build(row) for row in await db.execute(query)]
+        set_next_cursor(request, response, sort, products, limit, lambda p: _product_sort_values(sort, p))
+
+    if selected is not None and loaded != selected:
+        products = strip_fields(products, selected)
 
-    offset = (page - 1) * limit
-    return query.offset(offset).limit(limit).all()
+    entry = catalog_cache.store(cache_key, dumps(products), generation, next_cursor_headers(response))
+    return cached_response(request, entry)
+
+@router.get("/batch", response_model=pyd.ProductBatchRead)
+async def get_products_batch(
+    request: Request,
+    ids: List[int] = Query(..., min_length=1, max_length=PRODUCT_BATCH_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Товары по списку id (?ids=1&ids=2...).
+
+    Товары, которых нет в кэше, загружаются одним запросом с IN. Каждый
+    товар сериализуется так же, как в /product/{product_id}, и попадает
+    в тот же кэш. Ненайденные id перечислены в missing.
+    """
+    generation = catalog_cache.generation
+    bodies = {}
+    for product_id in ids:
+        entry = catalog_cache.get(catalog_cache.product_key(product_id))
+        if entry is not None:
+            bodies[product_id] = entry.body
+
+    wanted = set(ids) - bodies.keys()
+    if wanted:
+        for product in await db.scalars(select(m.Product).where(m.Product.id.in_(wanted))):
+            bodies[product.id] = catalog_cache.store(
+                catalog_cache.product_key(product.id), _product_body(product), generation
+            ).body
+
+    missing = [product_id for product_id in dict.fromkeys(ids) if product_id not in bodies]
+    body = (
+        b'{"products":[' + b",".join(bodies.get(product_id, b"null") for product_id in ids)
+        + b'],"missing":' + dumps(missing) + b"}"
+    )
+    return cached_response(request, catalog_cache.entry(body))
 
 @router.get("/{product_id}", response_model=pyd.ProductBase)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(m.Product).get(product_id)
+async def get_product(request: Request, product_id: int, db: AsyncSession = Depends(get_async_db)):
+    generation = catalog_cache.generation
+    cache_key = catalog_cache.product_key(product_id)
+    entry = catalog_cache.get(cache_key)
+    if entry is not None:
+        return cached_response(request, entry)
+
+    product = await db.get(m.Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Товар не найден")
-    return product
+    entry = catalog_cache.store(cache_key, _product_body(product), generation)
+    return cached_response(request, entry)
 
 @router.post("/create", response_model=pyd.ProductBase)
-def create_product(
+async def create_product(
     product_data: pyd.ProductCreate,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role_id not in (2, 3):
         raise HTTPException(
@@ -59,7 +224,7 @@ def create_product(
             detail="Недостаточно прав для создания продукта"
         )
 
-    category = db.query(m.Category).filter(m.Category.id == product_data.category_id).first()
+    category = await db.get(m.Category, product_data.category_id)
     if not category:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -68,16 +233,31 @@ def create_product(
 
     product = m.Product(**product_data.dict())
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    catalog_cache.invalidate_lists()
+    await db.refresh(product)
     return product
 
+@router.post("/import", response_model=pyd.ProductImportResult)
+async def import_products_bulk(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    format: Optional[Literal["csv", "ndjson"]] = Query(None),
+):
+    if current_user.role_id not in (2, 3):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Недостаточно прав для импорта товаров"
+        )
+    if format is None:
+        format = "ndjson" if "ndjson" in request.headers.get("content-type", "") else "csv"
+    return await import_products(request.stream(), format)
 
 @router.put("/update/{product_id}", response_model=pyd.ProductBase)
-def update_product(
-    product_id: int, product_data: pyd.ProductCreate, 
-    db: Session = Depends(get_db), 
-    current_user: m.User = Depends(get_current_user)
+async def update_product(
+    product_id: int, product_data: pyd.ProductUpdate, 
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: Principal = Depends(get_current_user)
     ):
     
     if current_user.role_id not in (2, 3):
@@ -89,19 +269,18 @@ def update_product(
     if product_data.category_id == 0:
         raise HTTPException(status_code=400, detail="category_id не может быть 0")    
     
-    product = db.query(m.Product).get(product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Товар не найден")
-    
-    for key, value in product_data.dict().items():
-        setattr(product, key, value)
-    
-    db.commit()
-    db.refresh(product)
-    return product
+    await compare_and_swap(
+        db, m.Product, product_id, product_data.version,
+        not_found="Товар не найден",
+        conflict="Товар был изменен другим пользователем, загрузите его заново и повторите запрос",
+        **product_data.model_dump(exclude={"version"}),
+    )
+    await db.commit()
+    catalog_cache.invalidate_products([product_id])
+    return await db.get(m.Product, product_id, populate_existing=True)
 
 @router.delete("/delete/{product_id}")
-def delete_product(product_id: int, db: Session = Depends(get_db), current_user: m.User = Depends(get_current_user)):
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     
     if current_user.role_id not in (2, 3):
         raise HTTPException(
@@ -109,11 +288,12 @@ def delete_product(product_id: int, db: Session = Depends(get_db), current_user:
             detail="Недостаточно прав для создания продукта"
         )
         
-    product = db.query(m.Product).get(product_id)
+    product = await db.get(m.Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Товар не найден")
     
-    db.delete(product)
-    db.commit()
+    await db.delete(product)
+    await db.commit()
+    catalog_cache.invalidate_products([product_id])
     return {"detail": "Товар успешно удалён"}
 
@@ -1,24 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from auth import get_current_user
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from auth import Principal, get_current_user
+from database import get_async_db
 import models as m
 import pyd
+from catalog_cache import catalog_cache
+from ratings import apply_rating_change
+from pagination import order_by_key, paginate, set_next_cursor
+from streaming import ndjson_response
 from datetime import datetime, UTC
 
 router = APIRouter(prefix="/reviews", tags=["reviews"])
 
+REVIEW_COLUMNS = (
+    m.Review.id,
+    m.Review.product_id,
+    m.Review.user_id,
+    m.Review.rating,
+    m.Review.text,
+    m.Review.created_at,
+    m.Review.updated_at,
+)
+
+REVIEW_SORTS = {
+    "newest": (m.Review.created_at, m.Review.id),
+    "rating": (m.Review.rating, m.Review.id),
+}
+
+def _review_sort_values(sort: str, review) -> list:
+    if sort == "rating":
+        return [review.rating, review.id]
+    return [review.created_at, review.id]
+
+def _cast_review_cursor(sort: str, values: list) -> list:
+    if sort == "rating":
+        return [int(values[0]), int(values[1])]
+    return [datetime.fromisoformat(values[0]), int(values[1])]
+
 @router.post("/", response_model=pyd.ReviewRead)
-def create_review(
+async def create_review(
     review_data: pyd.ReviewCreate,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    existing = db.query(m.Review).filter_by(
+    existing = await db.scalar(select(m.Review).filter_by(
         product_id=review_data.product_id,
         user_id=current_user.id
-    ).first()
+    ))
     if existing:
         raise HTTPException(status_code=400, detail="Вы уже оставили отзыв на этот товар")
 
@@ -27,47 +57,82 @@ def create_review(
         user_id=current_user.id
     )
     db.add(new_review)
-    db.commit()
-    db.refresh(new_review)
+    await apply_rating_change(db, new_review.product_id, None, new_review.rating)
+    await db.commit()
+    catalog_cache.invalidate_products([new_review.product_id])
+    await db.refresh(new_review)
     return new_review
 
 @router.get("/product/{product_id}", response_model=List[pyd.ReviewRead])
-def get_reviews_by_product(product_id: int, db: Session = Depends(get_db)):
-    reviews = db.query(m.Review).filter(m.Review.product_id == product_id).all()
+async def get_reviews_by_product(
+    request: Request,
+    response: Response,
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    sort: Literal["newest", "rating"] = Query("newest"),
+    format: Literal["json", "ndjson"] = Query("json"),
+):
+    columns = REVIEW_SORTS[sort]
+    cast = lambda values: _cast_review_cursor(sort, values)
+
+    if format == "ndjson":
+        # Поток отдает все отзывы товара (после курсора, если он передан),
+        # читая их порциями, page и limit не применяются.
+        query = order_by_key(
+            select(*REVIEW_COLUMNS).where(m.Review.product_id == product_id),
+            columns, key=sort, cursor=cursor, descending=True, cast=cast,
+        )
+        return ndjson_response(query, lambda row: row._asdict())
+
+    query = paginate(
+        select(m.Review).where(m.Review.product_id == product_id),
+        columns, key=sort, cursor=cursor, page=page, limit=limit, descending=True, cast=cast,
+    )
+    reviews = (await db.scalars(query)).all()
+    set_next_cursor(request, response, sort, reviews, limit, lambda r: _review_sort_values(sort, r))
     return reviews
 
 @router.put("/{review_id}", response_model=pyd.ReviewRead)
-def update_review(
+async def update_review(
     review_id: int,
     review_data: pyd.ReviewUpdate,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    review = db.query(m.Review).get(review_id)
+    review = await db.get(m.Review, review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Отзыв не найден")
     if current_user.role_id not in (2, 3) and review.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Недостаточно прав для редактирования этого отзыва")
+    old_rating = review.rating
     for key, value in review_data.dict().items():
         setattr(review, key, value)
 
     review.updated_at = datetime.now(UTC)
-    db.commit()
-    db.refresh(review)
+    await apply_rating_change(db, review.product_id, old_rating, review.rating)
+    await db.commit()
+    if old_rating != review.rating:
+        catalog_cache.invalidate_products([review.product_id])
+    await db.refresh(review)
     return review
 
 @router.delete("/{review_id}")
-def delete_review(
+async def delete_review(
     review_id: int,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    review = db.query(m.Review).get(review_id)
+    review = await db.get(m.Review, review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Отзыв не найден")
     if current_user.role_id not in (2, 3) and review.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Недостаточно прав для удаления этого отзыва")
 
-    db.delete(review)
-    db.commit()
+    await db.delete(review)
+    await apply_rating_change(db, review.product_id, review.rating, None)
+    await db.commit()
+    catalog_cache.invalidate_products([review.product_id])
     return {"detail": "Отзыв успешно удалён"}
@@ -1,12 +1,12 @@
 from typing import List, Optional
-from auth import hash_password
-from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy import func
-from database import get_db
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlalchemy import func, select, update
+from database import get_async_db, open_read_session, open_write_session
+from sqlalchemy.ext.asyncio import AsyncSession
 import models as m
 import pyd
-from auth import get_current_user, hash_password
+from auth import Principal, auth_cache_stats, get_current_user, hash_password_async, invalidate_user
+from pagination import paginate, set_next_cursor
 
 router = APIRouter(
     prefix="/user",
@@ -14,37 +14,47 @@ router = APIRouter(
 )
 
 @router.post("/register")
-def register_user(user: pyd.UserCreate, db: Session = Depends(get_db)):
-    email_user = db.query(m.User).filter(m.User.email == user.email).first()
-    if email_user:
-        raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
-    name_user = db.query(m.User).filter(m.User.username == user.username).first()
-    if name_user:
-        raise HTTPException(status_code=400, detail="Username уже зарегистрирован")
-    
-    
-    hashed_pwd = hash_password(user.password)
-    new_user = m.User(
-        username=user.username,
-        email=user.email,
-        password=hashed_pwd,
-        role_id=1,
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+async def register_user(user: pyd.UserCreate):
+    # Хеширование идет без открытой сессии: соединение-писатель занято
+    # только вставкой.
+    async with open_read_session() as db:
+        email_user = await db.scalar(select(m.User.id).where(m.User.email == user.email))
+        if email_user:
+            raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
+        name_user = await db.scalar(select(m.User.id).where(m.User.username == user.username))
+        if name_user:
+            raise HTTPException(status_code=400, detail="Username уже зарегистрирован")
+
+    hashed_pwd = await hash_password_async(user.password)
+    async with open_write_session() as db:
+        db.add(m.User(
+            username=user.username,
+            email=user.email,
+            password=hashed_pwd,
+            role_id=1,
+        ))
+        await db.commit()
     return {"msg": "Пользователь успешно создан"}
 
 @router.get("/me")
-def get_me(current_user: m.User = Depends(get_current_user)):
+async def get_me(current_user: Principal = Depends(get_current_user)):
     return {"username": current_user.username, "email": current_user.email}
 
+@router.get("/auth-cache")
+async def get_auth_cache_stats(current_user: Principal = Depends(get_current_user)):
+    if current_user.role_id != 3:
+        raise HTTPException(status_code=403, detail="Только администратор может просматривать статистику кэша")
+    return auth_cache_stats()
+
 @router.get("/", response_model=List[pyd.UserRead])
-def get_all_users(
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user),
+async def get_all_users(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
     page: int = Query(1, ge=1),
     limit: int = Query(10, le=100),
+    cursor: Optional[str] = Query(None),
     username: Optional[str] = Query(None),
     email: Optional[str] = Query(None),
     role_id: Optional[int] = Query(None)
@@ -52,71 +62,86 @@ def get_all_users(
     if current_user.role_id != 3:
         raise HTTPException(status_code=403, detail="Только администратор может просматривать всех пользователей")
 
-    query = db.query(m.User)
+    query = select(m.User)
 
     if username:
-        query = query.filter(func.lower(m.User.username).like(f"%{username.lower()}%"))
+        query = query.where(func.lower(m.User.username).like(f"%{username.lower()}%"))
     if email:
-        query = query.filter(func.lower(m.User.email).like(f"%{email.lower()}%"))
+        query = query.where(func.lower(m.User.email).like(f"%{email.lower()}%"))
     if role_id:
-        query = query.filter(m.User.role_id == role_id)
+        query = query.where(m.User.role_id == role_id)
 
-    offset = (page - 1) * limit
-    users = query.offset(offset).limit(limit).all()
+    query = paginate(
+        query, (m.User.id,),
+        key="id", cursor=cursor, page=page, limit=limit,
+        cast=lambda values: [int(values[0])],
+    )
+    users = (await db.scalars(query)).all()
+    set_next_cursor(request, response, "id", users, limit, lambda u: [u.id])
     return users
 
 @router.get("/{user_id}", response_model=pyd.UserRead)
-def get_user_by_id(user_id: int, db: Session = Depends(get_db),  current_user: m.User = Depends(get_current_user)):
+async def get_user_by_id(user_id: int, db: AsyncSession = Depends(get_async_db),  current_user: Principal = Depends(get_current_user)):
     if current_user.role_id != 3:
         raise HTTPException(status_code=403, detail="Только администратор может просматривать всех пользователей")
-    user = db.query(m.User).filter(m.User.id == user_id).first()
+    user = await db.get(m.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     return user
 
 @router.put("/{user_id}", response_model=pyd.UserRead)
-def update_user(
+async def update_user(
     user_id: int,
     data: pyd.UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role_id != 3:
         raise HTTPException(status_code=403, detail="Только администратор может редактировать пользователей")
 
-    user = db.query(m.User).get(user_id)
+    async with open_read_session() as db:
+        user = await db.get(m.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
+    values = {}
     if data.username:
-        user.username = data.username
+        values["username"] = data.username
     if data.email:
-        user.email = data.email
+        values["email"] = data.email
     if data.password:
-        user.password = hash_password(data.password)
+        values["password"] = await hash_password_async(data.password)
     if data.role_id is not None:
-        user.role_id = data.role_id
-
-    db.commit()
-    db.refresh(user)
+        values["role_id"] = data.role_id
+
+    if values:
+        async with open_write_session() as db:
+            result = await db.execute(update(m.User).where(m.User.id == user_id).values(**values))
+            if result.rowcount != 1:
+                raise HTTPException(status_code=404, detail="Пользователь не найден")
+            await db.commit()
+        invalidate_user(user_id)
+        for name, value in values.items():
+            setattr(user, name, value)
     return user
 
 @router.delete("/{user_id}")
-def delete_user(
+async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: m.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role_id != 3:
         raise HTTPException(status_code=403, detail="Только администратор может удалять пользователей")
 
-    user = db.query(m.User).get(user_id)
+    user = await db.get(m.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    if user.orders:
+    has_orders = await db.scalar(select(m.Order.id).where(m.Order.user_id == user.id).limit(1))
+    if has_orders:
         raise HTTPException(status_code=400, detail="Нельзя удалить пользователя с заказами")
 
 
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    invalidate_user(user.id)
     return {"detail": "Пользователь успешно удалён"}
@@ -0,0 +1,69 @@
+from datetime import datetime
+from typing import Dict, Iterable
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+import models as m
+
+sales = m.SalesDaily.__table__
+products = m.Product.__table__
+
+_apply_stmt = insert(sales).values(
+    day=bindparam("day"),
+    product_id=bindparam("pid"),
+    category_id=select(products.c.category_id).where(products.c.id == bindparam("pid")).scalar_subquery(),
+    units=bindparam("units"),
+    revenue=bindparam("revenue"),
+    item_count=bindparam("items"),
+)
+# excluded хранит дельту этого изменения, а не итог: она прибавляется
+# к строке дня, поэтому параллельные заказы не затирают друг друга.
+_apply_stmt = _apply_stmt.on_conflict_do_update(
+    index_elements=[sales.c.day, sales.c.product_id],
+    set_={
+        column: sales.c[column] + _apply_stmt.excluded[column]
+        for column in ("units", "revenue", "item_count")
+    },
+)
+
+def _delta(removed: Iterable, added: Iterable) -> Dict[int, dict]:
+    delta: Dict[int, dict] = {}
+    for items, sign in ((removed, -1), (added, 1)):
+        for item in items:
+            row = delta.setdefault(item.product_id, {"units": 0, "revenue": 0.0, "items": 0})
+            row["units"] += sign * item.quantity
+            row["revenue"] += sign * item.quantity * float(item.price_at_purchase)
+            row["items"] += sign
+    return {product_id: row for product_id, row in delta.items() if any(row.values())}
+
+async def apply_sales_change(
+    db: AsyncSession,
+    created_at: datetime,
+    removed: Iterable = (),
+    added: Iterable = (),
+):
+    """Обновляет дневные продажи в текущей транзакции.
+
+    Продажи относятся ко дню создания заказа. removed — позиции заказа
+    до изменения (пусто для нового), added — после (пусто для удаленного).
+    """
+    delta = _delta(removed, added)
+    if delta:
+        await db.execute(
+            _apply_stmt,
+            [{"day": created_at.date(), "pid": product_id, **row} for product_id, row in delta.items()],
+        )
+        # Товар, который из заказов этого дня убрали полностью, не оставляет нулевых строк.
+        await db.execute(
+            delete(sales).where(
+                sales.c.day == created_at.date(),
+                sales.c.product_id.in_(list(delta)),
+                sales.c.item_count == 0,
+            )
+        )
+
+def rebuild_sales_daily(connection: Connection):
+    """Пересчитывает дневные продажи по всем заказам."""
+    for statement in m.SALES_DAILY_REBUILD:
+        connection.exec_driver_sql(statement)
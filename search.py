@@ -0,0 +1,41 @@
+import re
+from typing import Optional
+from sqlalchemy import column, func, literal_column, table
+import models as m
+
+products_fts = table("products_fts", column("rowid"))
+
+_fts_table = literal_column("products_fts")
+
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def _prefix_terms(text: str) -> Optional[str]:
+    tokens = _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def match_expression(name: Optional[str] = None, q: Optional[str] = None) -> Optional[str]:
+    parts = []
+    if name:
+        terms = _prefix_terms(name)
+        if terms:
+            parts.append(f"(name : ({terms}))")
+    if q:
+        terms = _prefix_terms(q)
+        if terms:
+            parts.append(f"({terms})")
+    return " AND ".join(parts) or None
+
+def filter_products(query, match: str):
+    return (
+        query
+        .join(products_fts, products_fts.c.rowid == m.Product.id)
+        .where(_fts_table.op("MATCH")(match))
+    )
+
+def relevance():
+    return func.bm25(_fts_table, NAME_WEIGHT, DESCRIPTION_WEIGHT)
@@ -0,0 +1,19 @@
+from decimal import Decimal
+from typing import Optional
+import orjson
+from fastapi import Response
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+def dumps(data) -> bytes:
+    """Кодирует в JSON через orjson (datetime — в ISO 8601, как у pydantic)."""
+    return orjson.dumps(data, default=_default)
+
+def json_response(data, headers: Optional[dict] = None) -> Response:
+    return Response(content=dumps(data), media_type="application/json", headers=headers)
+
+def money(value) -> Optional[float]:
+    return None if value is None else float(value)
@@ -0,0 +1,46 @@
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Callable, Iterable, Optional
+from fastapi.responses import StreamingResponse
+from config import settings
+from database import open_read_session
+from serializers import dumps
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def ndjson_line(data: dict) -> bytes:
+    # Тот же JSON, что и в ответах API.
+    return dumps(data) + b"\n"
+
+def csv_lines(rows: Iterable[Iterable]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(_csv_value(value) for value in row)
+    return buffer.getvalue().encode()
+
+async def stream_partitions(statement, batch_size: Optional[int] = None) -> AsyncIterator[list]:
+    """Читает результат запроса порциями через серверный курсор.
+
+    Открывает собственную сессию чтения: сессия из зависимости закрывается
+    раньше, чем StreamingResponse начинает отдавать тело.
+    """
+    batch_size = batch_size or settings.STREAM_BATCH_SIZE
+    async with open_read_session() as db:
+        result = await db.stream(statement.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield rows
+
+async def _ndjson_body(statement, to_dict: Callable) -> AsyncIterator[bytes]:
+    async for rows in stream_partitions(statement):
+        yield b"".join(ndjson_line(to_dict(row)) for row in rows)
+
+def ndjson_response(statement, to_dict: Callable, headers: Optional[dict] = None) -> StreamingResponse:
+    return StreamingResponse(_ndjson_body(statement, to_dict), media_type="application/x-ndjson", headers=headers)
@@ -0,0 +1,39 @@
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+async def compare_and_swap(
+    db: AsyncSession,
+    model,
+    object_id: int,
+    expected_version: Optional[int],
+    not_found: str,
+    conflict: str,
+    **values,
+):
+    """Обновляет запись, только если ее версия не изменилась, и увеличивает версию.
+
+    UPDATE ... SET version = version + 1 WHERE id = :id AND version = :expected
+    выполняется одним запросом без предварительных блокировок. Если строка
+    не обновилась, возвращается 404 (записи нет) или 409 с текущей версией,
+    чтобы клиент перечитал запись и повторил запрос. Без expected_version
+    версия не проверяется, но все равно увеличивается.
+    """
+    statement = (
+        update(model)
+        .where(model.id == object_id)
+        .values(version=model.version + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    if expected_version is not None:
+        statement = statement.where(model.version == expected_version)
+    result = await db.execute(statement)
+    if result.rowcount == 1:
+        return
+
+    current = await db.scalar(select(model.version).where(model.id == object_id))
+    await db.rollback()
+    if current is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    raise HTTPException(status_code=409, detail={"message": conflict, "version": current})